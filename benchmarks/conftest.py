@@ -0,0 +1,86 @@
+"""
+Benchmarks of the rendering, encoding and transport hot paths, for
+pytest-benchmark. Every run is saved as JSON under .benchmarks, compare
+runs (say of two commits) with --benchmark-compare:
+
+    pytest benchmarks
+    pytest benchmarks --benchmark-compare --benchmark-group-by=name
+
+Besides the timings, every benchmark records the CPU time and the peak
+memory allocated per frame in its extra_info.
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+import pytest
+
+# Import the library on its own, the integration needs Home Assistant
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'custom_components', 'divoom_wifi'))
+
+from pixoo import Pixoo  # noqa: E402
+from pixoo.emulator import PixooEmulator  # noqa: E402
+
+SIZES = (16, 32, 64)
+
+# Calls per measurement of CPU time, outside the timed rounds
+CPU_ROUNDS = 20
+
+
+@pytest.fixture(params=SIZES, ids=lambda size: '{0}px'.format(size))
+def size(request):
+    return request.param
+
+
+@pytest.fixture
+def device_address(size):
+    # An emulated device on localhost, without latency
+    with PixooEmulator(size=size) as emulator:
+        yield emulator.address
+
+
+@pytest.fixture
+def pixoo(size):
+    # Simulated, nothing leaves the process
+    return Pixoo('localhost', size, simulated=True)
+
+
+@pytest.fixture
+def device_pixoo(device_address, size):
+    pixoo = Pixoo(device_address, size)
+    yield pixoo
+    pixoo.close()
+
+
+@pytest.fixture
+def per_frame(benchmark):
+    # Benchmarks function, then records its CPU time and peak allocations
+    # per call in the results. setup returns the arguments for one call,
+    # for functions that change them.
+    def run(function, setup=None, rounds=100):
+        def arguments():
+            return (setup() if setup is not None else ()), {}
+
+        result = benchmark.pedantic(function, setup=arguments, rounds=rounds, warmup_rounds=1)
+
+        # Every call gets its own setup right before it, like in the timed
+        # rounds, and only the call is counted
+        cpu_time = 0.0
+        for _ in range(CPU_ROUNDS):
+            args = arguments()[0]
+            start = time.process_time()
+            function(*args)
+            cpu_time = cpu_time + time.process_time() - start
+        benchmark.extra_info['cpu_ms_per_frame'] = cpu_time / CPU_ROUNDS * 1000
+
+        args = arguments()[0]
+        tracemalloc.start()
+        try:
+            function(*args)
+            benchmark.extra_info['peak_allocated_bytes_per_frame'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return result
+
+    return run
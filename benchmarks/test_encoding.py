@@ -0,0 +1,40 @@
+"""Turning the frame buffer into a request, as push does before posting it."""
+from pixoo import encode_frame_request, frame_digest
+from pixoo.cache import PicDataCache
+
+
+def _encode(cache, frame, size):
+    request_dict = {
+        'Command': 'Draw/SendHttpGif',
+        'PicNum': 1,
+        'PicWidth': size,
+        'PicOffset': 0,
+        'PicID': 1,
+        'PicSpeed': 1000
+    }
+    return encode_frame_request(request_dict, cache.encode(frame_digest(frame), frame))
+
+
+def test_encode(size, per_frame):
+    # A frame that wasn't sent before: digest, base64 and the request body
+    frame = bytes(range(256)) * (size * size * 3 // 256)
+    cache = PicDataCache()
+
+    def setup():
+        cache.clear()
+        return ()
+
+    per_frame(lambda: _encode(cache, frame, size), setup)
+
+
+def test_encode_cached(size, per_frame):
+    # The same frame again, only the digest and the request body
+    frame = bytes(range(256)) * (size * size * 3 // 256)
+    cache = PicDataCache()
+    per_frame(lambda: _encode(cache, frame, size))
+
+
+def test_push_simulated(pixoo, per_frame):
+    # Everything but the network: digest, encoding and the simulator
+    # decoding the request
+    per_frame(lambda: pixoo.push(force=True))
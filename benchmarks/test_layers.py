@@ -0,0 +1,55 @@
+"""A clock ticking over a background, redrawn or as a layer."""
+import random
+
+import pytest
+from PIL import Image
+
+ART = Image.radial_gradient('L').convert('RGB')
+TIMES = ['12:{0:02}'.format(minute) for minute in range(60)]
+
+
+def _draw_art(pixoo):
+    # Scaling happens in place
+    pixoo.draw_image(ART.copy())
+
+
+def _draw_art_titles_graph(pixoo):
+    # As show_album_and_artist and a sensor history would draw them
+    _draw_art(pixoo)
+    for line, title in enumerate(('artist', 'album', 'track')):
+        pixoo.draw_text(title, (1, pixoo.size - 18 + line * 6), (255, 255, 0))
+    values = [random.randint(0, pixoo.size // 2) for _ in range(pixoo.size)]
+    pixoo.draw_polyline(list(enumerate(values)), (0, 255, 0))
+
+
+BACKGROUNDS = pytest.mark.parametrize('draw_background', (_draw_art, _draw_art_titles_graph),
+                                      ids=('art', 'art_titles_graph'))
+
+
+@BACKGROUNDS
+def test_clock_redrawn(pixoo, per_frame, draw_background):
+    random.seed(0)
+    ticks = iter(range(10 ** 9))
+
+    def tick():
+        draw_background(pixoo)
+        pixoo.draw_text(TIMES[next(ticks) % 60], (1, 1), (255, 255, 255))
+        pixoo.push()
+
+    per_frame(tick)
+
+
+@BACKGROUNDS
+def test_clock_layered(pixoo, per_frame, draw_background):
+    random.seed(0)
+    ticks = iter(range(10 ** 9))
+    draw_background(pixoo)
+    pixoo.add_layer('clock', z=1)
+
+    def tick():
+        with pixoo.layer('clock'):
+            pixoo.fill()
+            pixoo.draw_text(TIMES[next(ticks) % 60], (1, 1), (255, 255, 255))
+        pixoo.push()
+
+    per_frame(tick)
@@ -0,0 +1,71 @@
+"""Drawing into the frame buffer, nothing is sent."""
+import random
+
+import pytest
+from PIL import Image
+
+from pixoo import ImageResampleMode
+from pixoo.shapes import line_spans
+
+
+def test_fill(pixoo, per_frame):
+    per_frame(pixoo.fill, lambda: ((255, 0, 0),))
+
+
+def test_draw_pixel(pixoo, per_frame):
+    # A frame's worth of scattered pixels, one diagonal across the panel
+    def draw():
+        for position in range(pixoo.size):
+            pixoo.draw_pixel((position, position), (0, 255, 0))
+
+    per_frame(draw)
+
+
+@pytest.mark.parametrize('source_size', (16, 64, 256))
+@pytest.mark.parametrize('image_resample_mode', (ImageResampleMode.PIXEL_ART, ImageResampleMode.SMOOTH),
+                         ids=('pixel_art', 'lanczos'))
+def test_draw_image(pixoo, per_frame, source_size, image_resample_mode):
+    source = Image.radial_gradient('L').resize((source_size, source_size)).convert('RGB')
+
+    # Scaling happens in place, every round gets its own copy
+    per_frame(lambda image: pixoo.draw_image(image, image_resample_mode=image_resample_mode),
+              lambda: (source.copy(),))
+
+
+def test_draw_text(pixoo, per_frame):
+    lines = [(0, y) for y in range(0, pixoo.size - 5, 6)]
+
+    def draw():
+        for xy in lines:
+            pixoo.draw_text('12:34 ABC', xy, (255, 255, 255))
+
+    per_frame(draw)
+
+
+def test_draw_line(pixoo, per_frame):
+    # A star of lines through the center, flat, steep and diagonal
+    last = pixoo.size - 1
+    segments = [((x, 0), (last - x, last)) for x in range(0, pixoo.size, 4)]
+    segments += [((0, y), (last, last - y)) for y in range(0, pixoo.size, 4)]
+
+    def draw():
+        for start_xy, stop_xy in segments:
+            pixoo.draw_line(start_xy, stop_xy, (0, 0, 255))
+
+    per_frame(draw)
+
+
+def test_draw_polyline(pixoo, per_frame):
+    # A sensor history, one value per column
+    random.seed(0)
+    values = [random.randint(0, pixoo.size - 1) for _ in range(pixoo.size)]
+    per_frame(lambda: pixoo.draw_polyline(list(enumerate(values)), (255, 0, 0)))
+
+
+def test_draw_shapes(pixoo, per_frame):
+    # Random segments filled as spans in one go
+    random.seed(0)
+    last = pixoo.size - 1
+    segments = [((random.randint(0, last), random.randint(0, last)),
+                 (random.randint(0, last), random.randint(0, last))) for _ in range(64)]
+    per_frame(lambda: pixoo.draw_shapes((line_spans(a, b), (255, 0, 0)) for a, b in segments))
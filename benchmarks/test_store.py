@@ -0,0 +1,24 @@
+"""Preparing a frame from an image file or reading it from a FrameStore."""
+import pytest
+from PIL import Image
+
+from pixoo.store import FrameStore
+
+
+@pytest.fixture
+def image_path(tmp_path):
+    path = tmp_path / 'noise.png'
+    Image.effect_noise((256, 256), 64).convert('RGB').save(path)
+    return str(path)
+
+
+def test_frame_from_file(pixoo, per_frame, image_path):
+    # What show_image does before pushing
+    per_frame(lambda: pixoo.draw_image(image_path))
+
+
+def test_frame_from_store(pixoo, per_frame, image_path, tmp_path):
+    with FrameStore(str(tmp_path / 'frames.pxfs'), pixoo.size) as store:
+        store.add('noise', [image_path])
+        size = (pixoo.size, pixoo.size)
+        per_frame(lambda: pixoo.draw_rgb_bytes(store.frame('noise'), size))
@@ -0,0 +1,19 @@
+"""Frames and animations posted to the stand-in device on localhost."""
+from PIL import Image
+
+
+def test_push(device_pixoo, per_frame):
+    frames = iter(range(10 ** 9))
+
+    def setup():
+        # A different frame every round, so none of them is skipped
+        device_pixoo.fill((next(frames) % 256, 0, 0))
+        return ()
+
+    per_frame(device_pixoo.push, setup, rounds=50)
+
+
+def test_send_animation(device_pixoo, per_frame):
+    size = device_pixoo.size
+    frames = [Image.new('RGB', (size, size), (value * 30, 0, 0)) for value in range(8)]
+    per_frame(lambda: device_pixoo.send_animation(frames, 100), rounds=10)
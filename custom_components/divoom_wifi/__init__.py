@@ -3,19 +3,33 @@ from __future__ import annotations
 
 import logging
 import asyncio
+import functools
+import multiprocessing
 from pprint import pformat
+import aiohttp
 import voluptuous as vol
 
 from homeassistant.core import HomeAssistant
 import homeassistant.helpers.config_validation as cv
-from homeassistant.const import CONF_NAME, CONF_MAC, CONF_IP_ADDRESS, CONF_DEVICE_ID, Platform
+from homeassistant.const import CONF_NAME, CONF_MAC, CONF_IP_ADDRESS, CONF_DEVICE_ID, CONF_SCAN_INTERVAL, Platform
 from homeassistant.config_entries import ConfigEntry
-from .pixoo import Pixoo
-from .const import DOMAIN, CONF_MEDIA_DIR, CONF_DEVICE_TYPE, DEFAULT_DEVICE_ID
+from homeassistant.exceptions import ConfigEntryNotReady
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
+from homeassistant.helpers.storage import STORAGE_DIR
+from datetime import timedelta
+from .coordinator import DivoomWifiCoordinator
+from .pixoo.async_pixoo import AsyncPixoo
+from .pixoo.cache import FrameCache
+from .pixoo.library import MediaLibrary
+from .pixoo.transport import DeviceUnavailableError
+from .const import (
+    DOMAIN, CONF_MEDIA_DIR, CONF_MEDIA_DIR_DEFAULT, CONF_DEVICE_TYPE, DEFAULT_DEVICE_ID, CONNECT_TIMEOUT, CONFIG_TTL, DEFAULT_SCAN_INTERVAL,
+    FRAME_CACHE_BYTES,
+)
 
 _LOGGER = logging.getLogger(__name__)
 
-PLATFORMS = [Platform.LIGHT, Platform.NUMBER]
+PLATFORMS = [Platform.LIGHT, Platform.NUMBER, Platform.SENSOR]
 
 CONFIG_SCHEMA = vol.Schema(
     {
@@ -49,17 +63,61 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
             options={},
         )
 
-    hass.data.setdefault(DOMAIN, {
-        "divoom_device": None
-    })
+    # Every config entry is a device of its own, with its own client,
+    # coordinator and media library
+    hass.data.setdefault(DOMAIN, {})
 
     divoomWifiDevice = None
     if entry.data[CONF_DEVICE_TYPE] == "pixoo":
-        divoomWifiDevice = await hass.async_add_executor_job(Pixoo, entry.data[CONF_IP_ADDRESS])
+        divoomWifiDevice = AsyncPixoo(entry.data[CONF_IP_ADDRESS], async_get_clientsession(hass),
+                                      config_ttl=CONFIG_TTL,
+                                      frame_cache=FrameCache(max_bytes=FRAME_CACHE_BYTES))
+        # Don't hold up Home Assistant for a device that is offline, it
+        # retries the entry later when we aren't ready
+        try:
+            await asyncio.wait_for(divoomWifiDevice.connect(), CONNECT_TIMEOUT)
+        except (asyncio.TimeoutError, aiohttp.ClientError, DeviceUnavailableError) as ex:
+            await divoomWifiDevice.close()
+            raise ConfigEntryNotReady(
+                "Could not connect to {0}: {1}".format(entry.data[CONF_IP_ADDRESS], ex)
+            ) from ex
     else:
         raise "device_type {0} does not exist, divoom_wifi will not work".format(entry.data[CONF_DEVICE_TYPE])
 
-    hass.data[DOMAIN]["divoom_device"] = divoomWifiDevice
+    # The device is closed again if the rest of the setup fails, its
+    # transport may be probing it in the background
+    try:
+        # One coordinator polls the device for all entities
+        scan_interval = entry.options.get(CONF_SCAN_INTERVAL)
+        coordinator = DivoomWifiCoordinator(
+            hass, divoomWifiDevice,
+            timedelta(seconds=scan_interval) if scan_interval else DEFAULT_SCAN_INTERVAL
+        )
+        await coordinator.async_config_entry_first_refresh()
+
+        # The media directory is converted to frames in worker processes, spawned
+        # rather than forked from our threads. Items that are asked for before
+        # the first update is done are converted on demand.
+        media_library = await hass.async_add_executor_job(functools.partial(
+            MediaLibrary,
+            hass.config.path(entry.data.get(CONF_MEDIA_DIR, CONF_MEDIA_DIR_DEFAULT)),
+            divoomWifiDevice.size,
+            hass.config.path(STORAGE_DIR, DOMAIN, entry.entry_id),
+            mp_context=multiprocessing.get_context("spawn")
+        ))
+    except BaseException:
+        await divoomWifiDevice.close()
+        raise
+    # Cancelled when the entry is unloaded
+    entry.async_create_background_task(
+        hass, _async_update_media_library(hass, media_library), "divoom_wifi media library update"
+    )
+
+    hass.data[DOMAIN][entry.entry_id] = {
+        "divoom_device": divoomWifiDevice,
+        "divoom_coordinator": coordinator,
+        "divoom_media_library": media_library
+    }
 
     for component in PLATFORMS:
         hass.async_create_task(
@@ -68,6 +126,14 @@ async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
 
     return True
 
+async def _async_update_media_library(hass: HomeAssistant, media_library: MediaLibrary) -> None:
+    try:
+        converted = await hass.async_add_executor_job(media_library.update)
+    except (OSError, RuntimeError) as ex:
+        _LOGGER.warning("Could not update the media library: %s", ex)
+        return
+    _LOGGER.debug("Converted %d media files", len(converted))
+
 async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Unload config entry"""
     unload_ok = all(
@@ -79,7 +145,8 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
         )
     )
     if unload_ok:
-        hass.data[DOMAIN].pop(entry.entry_id)
+        entry_data = hass.data[DOMAIN].pop(entry.entry_id)
+        await entry_data["divoom_device"].close()
         if not hass.data[DOMAIN]:
             hass.data.pop(DOMAIN)
     return unload_ok
@@ -2,12 +2,16 @@ import voluptuous as vol
 from typing import Any
 import logging
 
+import aiohttp
+
 from homeassistant import config_entries
 from homeassistant.const import CONF_MAC, CONF_IP_ADDRESS, CONF_DEVICE_ID, CONF_NAME
+from homeassistant.core import HomeAssistant
 from homeassistant.data_entry_flow import FlowResult
+from homeassistant.helpers.aiohttp_client import async_get_clientsession
 import homeassistant.helpers.config_validation as cv
 
-from .pixoo.helpers import discover_wifi_devices
+from .pixoo.async_pixoo import discover_wifi_devices
 
 
 from .const import CONF_DEVICE_TYPE, DOMAIN
@@ -19,12 +23,12 @@ def format_unique_id(address: str) -> str:
     return address.replace(":", "").lower()
     
 
-def discover_devices() -> dict[str, Any]:
+async def async_discover_devices(hass: HomeAssistant) -> dict[str, Any]:
     """Discover Wifi devices."""
     try:
 #        _LOGGER.debug("Discovering devices on device_id: %d", device_id)
-        result = discover_wifi_devices()
-    except OSError as ex:
+        result = await discover_wifi_devices(async_get_clientsession(hass))
+    except (OSError, aiohttp.ClientError) as ex:
         # OSError is generally thrown if a bluetooth device isn't found
         _LOGGER.error("Couldn't discover wifi devices: %s", ex)
         return []
@@ -79,7 +83,7 @@ class DivoomWifiConfigFlow(config_entries.ConfigFlow, domain=DOMAIN):
 #            _LOGGER.debug("device id: {}".format(device_id))
 
         else:
-            self._wifi_devices = await self.hass.async_add_executor_job(discover_devices)
+            self._wifi_devices = await async_discover_devices(self.hass)
 
             if self._wifi_devices == []:
                 _LOGGER.debug("no_devices_found")
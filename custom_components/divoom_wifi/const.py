@@ -1,3 +1,4 @@
+from datetime import timedelta
 from typing import Final
 import logging
 
@@ -8,6 +9,14 @@ CONF_DEVICE_TYPE: Final = 'device_type'
 CONF_MEDIA_DIR: Final = 'media_directory'
 CONF_MEDIA_DIR_DEFAULT: Final = "pixelart"
 DEFAULT_DEVICE_ID: Final = -1
+CONNECT_TIMEOUT: Final = 10
+CONFIG_TTL: Final = 5
+FRAME_CACHE_BYTES: Final = 1024 * 1024
+DEFAULT_SCAN_INTERVAL: Final = timedelta(seconds=30)
+MAX_SCAN_INTERVAL: Final = timedelta(minutes=5)
 BT_PREFIX: Final = "BT_"
 SERVICE_SHOW_IMAGE = "show_image"
-SERVICE_SHOW_ALBUM_ARTIST = "show_album_and_artist"
\ No newline at end of file
+SERVICE_SHOW_ALBUM_ARTIST = "show_album_and_artist"
+SERVICE_SHOW_ANIMATION = "show_animation"
+SERVICE_SHOW_MEDIA = "show_media"
+DEFAULT_ALBUM_ARTIST_DURATION: Final = 30
\ No newline at end of file
@@ -0,0 +1,50 @@
+"""Polling coordinator for Divoom Wifi devices."""
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import timedelta
+from typing import Any
+
+import aiohttp
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator, UpdateFailed
+
+from .const import DOMAIN, MAX_SCAN_INTERVAL
+from .pixoo.async_pixoo import AsyncPixoo
+from .pixoo.transport import DeviceUnavailableError
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class DivoomWifiCoordinator(DataUpdateCoordinator[dict[str, Any]]):
+    """Polls the configuration of one device for all of its entities."""
+
+    def __init__(self, hass: HomeAssistant, device: AsyncPixoo, update_interval: timedelta) -> None:
+        """Initialize the coordinator."""
+        super().__init__(hass, _LOGGER, name=DOMAIN, update_interval=update_interval)
+        self.device = device
+        self._default_update_interval = update_interval
+
+    async def _async_update_data(self) -> dict[str, Any]:
+        """Fetch the device configuration, the device caches it for config_ttl."""
+        try:
+            await self.device.update_config()
+        except (asyncio.TimeoutError, aiohttp.ClientError, DeviceUnavailableError) as ex:
+            # Ask less often while the device is unreachable
+            self.update_interval = min(self.update_interval * 2, MAX_SCAN_INTERVAL)
+            raise UpdateFailed("Error communicating with device: {0}".format(ex)) from ex
+
+        config = self.device.device_config
+        if config.get("error_code", 0) != 0:
+            # An error or a response that wasn't JSON, ask again next time
+            self.device.invalidate_config()
+            raise UpdateFailed("Invalid response from device: {0}".format(config))
+
+        self.update_interval = self._default_update_interval
+        return self.snapshot(config)
+
+    def snapshot(self, config: dict[str, Any]) -> dict[str, Any]:
+        """The device configuration with the scores, which only the client knows."""
+        return dict(config, BlueScore=self.device.blue_score, RedScore=self.device.red_score)
@@ -0,0 +1,25 @@
+"""Diagnostics support for Divoom Wifi."""
+from __future__ import annotations
+
+from typing import Any
+
+from homeassistant.components.diagnostics import async_redact_data
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import CONF_IP_ADDRESS, CONF_MAC
+from homeassistant.core import HomeAssistant
+
+from .const import DOMAIN
+
+TO_REDACT = {CONF_IP_ADDRESS, CONF_MAC}
+
+
+async def async_get_config_entry_diagnostics(hass: HomeAssistant, entry: ConfigEntry) -> dict[str, Any]:
+    """Return the configuration and request metrics of the device."""
+    divoomWifiDevice = hass.data[DOMAIN][entry.entry_id]["divoom_device"]
+    coordinator = hass.data[DOMAIN][entry.entry_id]["divoom_coordinator"]
+
+    return {
+        "entry": async_redact_data(entry.as_dict(), TO_REDACT),
+        "device_config": coordinator.data,
+        "statistics": divoomWifiDevice.statistics,
+    }
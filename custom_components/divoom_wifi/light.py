@@ -15,17 +15,23 @@ from homeassistant.components.light import (
 )
 from homeassistant.const import CONF_NAME, CONF_MAC, CONF_IP_ADDRESS
 from homeassistant.core import (
-    HomeAssistant, Event)
+    HomeAssistant, Event, callback)
 from homeassistant.config_entries import ConfigEntry
+from homeassistant.exceptions import HomeAssistantError
 #from homeassistant.helpers.typing import ConfigType, DiscoveryInfoType
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers import entity_platform
 from homeassistant.helpers.event import async_track_state_change_event
 from homeassistant.helpers.entity import DeviceInfo
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
 
-from .const import DOMAIN, CONF_DEVICE_TYPE, CONF_MEDIA_DIR, CONF_MEDIA_DIR_DEFAULT, SERVICE_SHOW_IMAGE, SERVICE_SHOW_ALBUM_ARTIST
-from .pixoo import Pixoo
+from .const import (
+    DOMAIN, CONF_DEVICE_TYPE, CONF_MEDIA_DIR, CONF_MEDIA_DIR_DEFAULT, SERVICE_SHOW_IMAGE, SERVICE_SHOW_ALBUM_ARTIST,
+    SERVICE_SHOW_ANIMATION, SERVICE_SHOW_MEDIA, DEFAULT_ALBUM_ARTIST_DURATION,
+)
+from .coordinator import DivoomWifiCoordinator
 from .pixoo import Channel
+from .pixoo.library import MediaLibrary
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -61,10 +67,11 @@ async def async_setup_entry(
         "media_directory": media_dir
     }
 
-    divoomWifiDevice = hass.data[DOMAIN]["divoom_device"]
+    coordinator = hass.data[DOMAIN][entry.entry_id]["divoom_coordinator"]
+    media_library = hass.data[DOMAIN][entry.entry_id]["divoom_media_library"]
 
     async_add_entities([
-        DivoomWifiLight(data, divoomWifiDevice),
+        DivoomWifiLight(data, coordinator, media_library),
     ])
     
     platform = entity_platform.async_get_current_platform()
@@ -84,20 +91,41 @@ async def async_setup_entry(
         vol.Required("artist"): cv.string,
         vol.Required("album"): cv.string,
         vol.Required("track"): cv.string,
+        vol.Optional("duration", default=DEFAULT_ALBUM_ARTIST_DURATION): vol.All(
+          vol.Coerce(float), vol.Range(min=0)
+        ),
       },
       "async_show_album_and_artist"
       )
 
+    platform.async_register_entity_service(
+      SERVICE_SHOW_ANIMATION,
+      {
+        vol.Required("image_path"): cv.string,
+      },
+      "async_show_animation"
+      )
 
-class DivoomWifiLight(LightEntity):
+    platform.async_register_entity_service(
+      SERVICE_SHOW_MEDIA,
+      {
+        vol.Required("name"): cv.string,
+      },
+      "async_show_media"
+      )
+
+
+class DivoomWifiLight(CoordinatorEntity[DivoomWifiCoordinator], LightEntity):
     """Representation of Divoom Wifi light"""
 
-    def __init__(self, data, divoomWifiDevice: Pixoo) -> None:
+    def __init__(self, data, coordinator: DivoomWifiCoordinator, media_library: MediaLibrary) -> None:
         """Initialize a Divoom Wifi light"""
+        super().__init__(coordinator)
         self._attr_name = data["name"]
         self._attr_unique_id = data["mac"]
         self._device_type = data["device_type"]
         self._media_directory = data["media_directory"]
+        self._media_library = media_library
 
         self._attr_effect_list = [
             "FACES",
@@ -112,10 +140,12 @@ class DivoomWifiLight(LightEntity):
             "model": data["device_type"]
         }
 
-        self._divoomWifiDevice = divoomWifiDevice
+        self._divoomWifiDevice = coordinator.device
+        self._update_from_config()
 
 
     async def async_added_to_hass(self):
+        await super().async_added_to_hass()
         _LOGGER.debug("light added to hass")
         entity_id = self.entity_id[self.entity_id.find('.') + 1:]
         entity_ids = ["number.{}_score_1".format(entity_id), "number.{}_score_2".format(entity_id)]
@@ -154,31 +184,66 @@ class DivoomWifiLight(LightEntity):
         _LOGGER.debug(pformat(event))
 
     async def async_turn_on(self, **kwargs: Any) -> None:
-        if ATTR_BRIGHTNESS in kwargs:
-            await self.hass.async_add_executor_job(self._divoomWifiDevice.set_brightness, int(kwargs.get(ATTR_BRIGHTNESS, 255) / 255 * 100))
-        else:
-            await self.hass.async_add_executor_job(self._divoomWifiDevice.set_brightness, self._attr_brightness)
-
         if ATTR_RGB_COLOR in kwargs:
-            await self.hass.async_add_executor_job(self._divoomWifiDevice.fill, kwargs.get(ATTR_RGB_COLOR, (255, 255, 255)))
-            await self.hass.async_add_executor_job(self._divoomWifiDevice.push)
-        
-        if ATTR_EFFECT in kwargs:
-            await self.hass.async_add_executor_job(self._divoomWifiDevice.set_channel, Channel[kwargs.get(ATTR_EFFECT, "CUSTOM")])
+            # Filling the buffer is cheap enough to do on the event loop
+            self._divoomWifiDevice.fill(kwargs.get(ATTR_RGB_COLOR, (255, 255, 255)))
+            await self._divoomWifiDevice.push()
+
+        # Everything else goes to the device as a single command list
+        async with self._divoomWifiDevice.batch():
+            if ATTR_BRIGHTNESS in kwargs:
+                await self._divoomWifiDevice.set_brightness(int(kwargs.get(ATTR_BRIGHTNESS, 255) / 255 * 100))
+            else:
+                await self._divoomWifiDevice.set_brightness(self._attr_brightness)
 
-        await self.hass.async_add_executor_job(self._divoomWifiDevice.turn_on)
+            if ATTR_EFFECT in kwargs:
+                await self._divoomWifiDevice.set_channel(Channel[kwargs.get(ATTR_EFFECT, "CUSTOM")])
+
+            await self._divoomWifiDevice.turn_on()
+
+        await self.coordinator.async_request_refresh()
 
     async def async_turn_off(self, **kwargs: Any) -> None:
-        await self.hass.async_add_executor_job(self._divoomWifiDevice.turn_off)
+        await self._divoomWifiDevice.turn_off()
+        await self.coordinator.async_request_refresh()
 
-    async def async_device_update(self, warning: bool = True) -> None:
-        await self.hass.async_add_executor_job(self._divoomWifiDevice.update_config)
-        self._attr_is_on = bool(self._divoomWifiDevice.device_config["LightSwitch"])
-        self._attr_brightness = int(self._divoomWifiDevice.device_config["Brightness"] * 2.55)
+    @callback
+    def _handle_coordinator_update(self) -> None:
+        self._update_from_config()
+        super()._handle_coordinator_update()
 
-    async def async_show_image(self, image_path: str) -> None:
-        await self.hass.async_add_executor_job(self._divoomWifiDevice.show_albumart_from_url, image_path)
+    def _update_from_config(self) -> None:
+        config = self.coordinator.data
+        if config and "LightSwitch" in config:
+            self._attr_is_on = bool(config["LightSwitch"])
+            self._attr_brightness = int(config["Brightness"] * 2.55)
 
-    async def async_show_album_and_artist(self, image_path: str, artist: str, album: str, track: str) -> None:
-        await self.hass.async_add_executor_job(self._divoomWifiDevice.show_album_and_artist_from_url, image_path, artist, album, track)
-        
\ No newline at end of file
+    async def async_show_image(self, image_path: str) -> None:
+        await self._divoomWifiDevice.show_albumart_from_url(image_path)
+
+    async def async_show_album_and_artist(self, image_path: str, artist: str, album: str, track: str,
+                                          duration: float = DEFAULT_ALBUM_ARTIST_DURATION) -> None:
+        await self._divoomWifiDevice.show_album_and_artist_from_url(image_path, artist, album, track, duration)
+
+    async def async_show_animation(self, image_path: str) -> None:
+        if image_path.startswith(("http://", "https://")):
+            await self._divoomWifiDevice.show_animation_from_url(image_path)
+            return
+
+        # Relative paths are looked up in the media directory
+        path = os.path.join(self.hass.config.path(self._media_directory), image_path)
+        if not self.hass.config.is_allowed_path(path):
+            raise HomeAssistantError("Access to {} is not allowed".format(path))
+
+        await self._divoomWifiDevice.show_animation(path)
+
+    async def async_show_media(self, name: str) -> None:
+        # The frames were converted beforehand, all that's left is reading them
+        try:
+            frames, speeds = await self.hass.async_add_executor_job(self._media_library.load, name)
+        except KeyError as ex:
+            raise HomeAssistantError("{} is not in the media directory".format(name)) from ex
+        except ValueError as ex:
+            raise HomeAssistantError(str(ex)) from ex
+
+        await self._divoomWifiDevice.show_frames(frames, speeds)
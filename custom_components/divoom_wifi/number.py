@@ -8,7 +8,8 @@ from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.helpers.typing import ConfigType, DiscoveryInfoType
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.helpers import device_registry as dr
-from .pixoo import Pixoo
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
+from .coordinator import DivoomWifiCoordinator
 from .const import DOMAIN, ATTR_SCORE_1, ATTR_SCORE_2, CONF_DEVICE_TYPE
 from homeassistant.components.number import (
     NumberEntity,
@@ -29,9 +30,9 @@ async def async_setup_entry(
         "device_type": entry.data[CONF_DEVICE_TYPE]
     }
 
-    divoomWifiDevice = hass.data[DOMAIN]["divoom_device"]
+    coordinator = hass.data[DOMAIN][entry.entry_id]["divoom_coordinator"]
 
-    async_add_entities([ScoreNumber(1, data, divoomWifiDevice), ScoreNumber(2, data, divoomWifiDevice)])
+    async_add_entities([ScoreNumber(1, data, coordinator), ScoreNumber(2, data, coordinator)])
 
 #def setup_platform(
 #    hass: HomeAssistant,
@@ -49,12 +50,13 @@ async def async_setup_entry(
 #
 #    add_entities([ScoreNumber(1, name, device_type, mac), ScoreNumber(2, name, device_type, mac)])
 
-class ScoreNumber(NumberEntity):
+class ScoreNumber(CoordinatorEntity[DivoomWifiCoordinator], NumberEntity):
     """Representation of a Score."""
 
     _attr_has_entity_name = True
 
-    def __init__(self, num, data, divoomWifiDevice: Pixoo) -> None:
+    def __init__(self, num, data, coordinator: DivoomWifiCoordinator) -> None:
+        super().__init__(coordinator)
         name = data["name"]
         mac = data["mac"]
         device_type = data["device_type"]
@@ -70,19 +72,26 @@ class ScoreNumber(NumberEntity):
             "model": device_type
         }
 
-        self._divoomWifiDevice = divoomWifiDevice
+        self._divoomWifiDevice = coordinator.device
 
     @property
-    def state(self) -> float | None:
+    def native_value(self) -> float | None:
+        config = self.coordinator.data
+        if not config:
+            return None
         if self._num == 1:
-            return self._divoomWifiDevice.blue_score
+            return config.get("BlueScore")
         elif self._num == 2:
-            return self._divoomWifiDevice.red_score
+            return config.get("RedScore")
 
-    def set_native_value(self, value: float) -> None:
-        self._attr_state = int(value)
+    async def async_set_native_value(self, value: float) -> None:
         if self._num == 1:
-            self._divoomWifiDevice.blue_score = self._attr_state
+            self._divoomWifiDevice.blue_score = int(value)
         elif self._num == 2:
-            self._divoomWifiDevice.red_score = self._attr_state
-        self._divoomWifiDevice.update_score()
+            self._divoomWifiDevice.red_score = int(value)
+        await self._divoomWifiDevice.update_score()
+
+        # The device has no way to ask for the scores, so the snapshot is
+        # updated right away instead of polled
+        if self.coordinator.data is not None:
+            self.coordinator.async_set_updated_data(self.coordinator.snapshot(self.coordinator.data))
@@ -1,15 +1,36 @@
-import base64
+import contextlib
+import hashlib
+import io
+import itertools
 import json
 from enum import IntEnum
 
 import requests
+import requests.adapters
 import time
-from PIL import Image, ImageOps, ImageDraw, UnidentifiedImageError
+from PIL import Image, ImageOps, ImageDraw, ImageSequence, UnidentifiedImageError
 
 from ._colors import Palette
-from ._font import retrieve_glyph
+from .animation import (FramePrefetcher, MAX_ANIMATION_FRAMES, collapse_frames, frame_duration,
+                        limit_frames, pic_speed)
+from .cache import FrameCache, PicDataCache
+from .headless import HeadlessSimulator
+from .layers import Compositor, Layer
+from .metrics import Metrics
+from ._font import text_mask
+from .shapes import circle_spans, line_spans, polygon_spans, polyline_spans
+from .transport import Transport, is_idempotent
 from .helpers import url_image_handle
-#from .simulator import Simulator, SimulatorConfig
+
+
+def album_art_overlay(image, size=64):
+    # Darken the lower half of the album art so text stays readable on it
+    image = ImageOps.pad(image, (size, size), Image.NEAREST)
+    overlay = Image.new(image.mode, image.size)
+    mask = Image.new('L', image.size, 255)
+    draw = ImageDraw.Draw(mask)
+    draw.rectangle((0, size // 2, size, size), fill=128)
+    return Image.composite(image, overlay, mask)
 
 
 def clamp(value, minimum=0, maximum=255):
@@ -22,7 +43,7 @@ def clamp(value, minimum=0, maximum=255):
 
 
 def clamp_color(rgb):
-    return clamp(rgb[0]), clamp(rgb[1]), clamp(rgb[2])
+    return clamp(int(rgb[0])), clamp(int(rgb[1])), clamp(int(rgb[2]))
 
 
 def lerp(start, end, interpolant):
@@ -45,6 +66,43 @@ def round_location(xy):
     return round(xy[0]), round(xy[1])
 
 
+# Commands that leave the frame currently shown on the device untouched, so
+# they don't require the next push to be sent again
+FRAME_PRESERVING_COMMANDS = frozenset((
+    'Channel/SetBrightness',
+    'Device/PlayBuzzer',
+    'Device/SetDisTempMode',
+    'Device/SetTime24Flag',
+    'Device/SetUTC',
+    'Device/SetWhiteBalance',
+    'Sys/LogAndLat',
+    'Sys/TimeZone',
+))
+
+
+def preserves_frame(request_dict):
+    if request_dict['Command'] == 'Draw/CommandList':
+        return all(preserves_frame(command) for command in request_dict['CommandList'])
+
+    return request_dict['Command'] in FRAME_PRESERVING_COMMANDS
+
+
+def encode_frame_request(request_dict, pic_data):
+    # Splice the base64 encoded frame into the JSON ourselves, json.dumps
+    # would copy the biggest part of the request a few more times
+    return b''.join((json.dumps(request_dict)[:-1].encode(), b', "PicData": "', pic_data, b'"}'))
+
+
+def frame_digest(buffer):
+    return hashlib.blake2b(buffer, digest_size=16).digest()
+
+
+def _pic_speeds(pic_speed):
+    if isinstance(pic_speed, int):
+        return itertools.repeat(pic_speed)
+    return pic_speed
+
+
 class Channel(IntEnum):
     FACES = 0
     CLOUD = 1
@@ -63,17 +121,47 @@ class TextScrollDirection(IntEnum):
     RIGHT = 1
 
 
+def fit_image(image, size, image_resample_mode=ImageResampleMode.PIXEL_ART, pad_resample=False):
+    # Scale images that are too large for the display, then convert to RGB
+    if image.size[0] > size or image.size[1] > size:
+        if pad_resample:
+            image = ImageOps.pad(image, (size, size), image_resample_mode)
+        else:
+            image.thumbnail((size, size), image_resample_mode)
+
+    return image.convert('RGB')
+
+
+def decode_animation(image, size, image_resample_mode=ImageResampleMode.PIXEL_ART, pad_resample=False,
+                     tolerance=2, max_frames=MAX_ANIMATION_FRAMES):
+    # Decode the frames one at a time and only keep them at display size,
+    # frames that look the same are sent once and shown for longer.
+    # Returns a list of (image, PicSpeed).
+    frames = ((fit_image(frame.convert('RGB'), size, image_resample_mode, pad_resample),
+               frame_duration(frame.info))
+              for frame in ImageSequence.Iterator(image))
+    frames = limit_frames(list(collapse_frames(frames, tolerance)), max_frames)
+    return [(frame, pic_speed(duration)) for frame, duration in frames]
+
+
 class Pixoo:
-    __buffer = []
+    __buffer = None
     __buffers_send = 0
-    __counter = 0
-    __display_list = []
+    __config_expires = 0
+    __counter = None
+    __device_config = None
+    __display_list = None
+    __frames_skipped = 0
+    __last_frame_digest = None
     __refresh_counter_limit = 32
+    __session = None
     __simulator = None
-    __command_list = []
+    __transport = None
+    __command_list = None
 
-    def __init__(self, address, size=64, debug=False, refresh_connection_automatically=True, simulated=False):#,
-#                 simulation_config=SimulatorConfig()):
+    def __init__(self, address, size=64, debug=False, refresh_connection_automatically=True, simulated=False,
+                 pool_size=2, connect_timeout=5, read_timeout=10, connect=False,
+                 config_ttl=0, frame_cache=None, simulator=None):
         assert size in [16, 32, 64], \
             'Invalid screen size in pixels given. ' \
             'Valid options are 16, 32, and 64'
@@ -84,32 +172,109 @@ class Pixoo:
         self.size = size
         self.simulated = simulated
 
+        # How many seconds a retrieved device configuration stays valid
+        self.config_ttl = config_ttl
+
+        # Optional FrameCache for images shown from URLs
+        self.frame_cache = frame_cache
+
+        # Frames we sent before don't need to be encoded again
+        self.pic_data_cache = PicDataCache()
+
+        # Latency of the requests per command, render and encode times
+        self.metrics = Metrics()
+
         # Total number of pixels
         self.pixel_count = self.size * self.size
 
         # Generate URL
         self.__url = 'http://{0}/post'.format(address)
 
-        # Prefill the buffer
+        # Connection to the device, AsyncPixoo brings its own
+        self.__timeout = (connect_timeout, read_timeout)
+        self._open_transport(pool_size)
+
+        # Commands collected by batch(), None outside of one
+        self._batch = None
+
+        # Collected by add_command and add_display_item, every client has
+        # its own
+        self.__command_list = []
+        self.__display_list = []
+
+        # Requests are collected here instead of sent while an asynchronous
+        # client runs one of our commands (see async_pixoo.py)
+        self._deferred_requests = None
+
+        # Preallocate the frame buffer (RGB, row-major) and prefill it
+        self.__buffer = bytearray(self.pixel_count * 3)
         self.fill()
 
-        # Retrieve the counter
-        self.__load_counter()
-        
-        # Retrieve current device configuration
-        self.device_config = self.__get_config()
-        
+        # Layers composited over the frame buffer on push, by name
+        self.__layers = {}
+        self.__compositor = Compositor(self.size)
+
         # Default values for Scoreboard
         self.blue_score = 0
         self.red_score = 0
 
-        # Resetting if needed
-        if self.refresh_connection_automatically and self.__counter > self.__refresh_counter_limit:
-            self.__reset_counter()
+        # We're going to need a simulator, the requests go there instead
+        if self.simulated:
+            self.__simulator = simulator if simulator is not None else HeadlessSimulator(self.size)
+
+        # The counter and device configuration are retrieved on first use,
+        # unless we're asked to connect right away
+        if connect:
+            self.connect()
+
+    @property
+    def counter(self):
+        return self.__counter
+
+    @property
+    def device_config(self):
+        if self.__device_config is None:
+            self.update_config()
+        return self.__device_config
+
+    @device_config.setter
+    def device_config(self, device_config):
+        self.__device_config = device_config
+        self.__config_expires = time.monotonic() + self.config_ttl
+
+    @property
+    def frames_sent(self):
+        return self.__buffers_send
+
+    @property
+    def frames_skipped(self):
+        return self.__frames_skipped
+
+    @property
+    def layers(self):
+        # In the order they're composited, bottom first
+        return sorted(self.__layers.values(), key=lambda layer: layer.z)
+
+    @property
+    def simulator(self):
+        return self.__simulator
+
+    @property
+    def statistics(self):
+        # Everything we measured, as plain data for diagnostics
+        statistics = self.metrics.snapshot()
+        statistics.update({
+            'available': self.transport.available,
+            'frames_sent': self.__buffers_send,
+            'frames_skipped': self.__frames_skipped,
+            'pic_data_cache': self.pic_data_cache.stats,
+            'frame_cache': self.frame_cache.stats if self.frame_cache is not None else None
+        })
+        return statistics
 
-        # We're going to need a simulator
-#        if self.simulated:
-#            self.__simulator = Simulator(self, simulation_config)
+    @property
+    def transport(self):
+        return self.__transport
 
     def add_command(self, command):
         self.__command_list.append(command)
@@ -141,6 +306,27 @@ class Pixoo:
 
         self.__display_list.append(text_properties)
 
+    def add_layer(self, name, z=0, opacity=255, mask=None, transparent=Palette.BLACK):
+        layer = self.__layers[name] = Layer(name, self.size, z, opacity, mask, transparent)
+        return layer
+
+    @contextlib.contextmanager
+    def batch(self):
+        # Commands (not frames) issued inside this block are sent together as
+        # a single Draw/CommandList when the outermost block exits
+        if self._batch is not None:
+            yield self
+            return
+
+        self._batch = []
+        try:
+            yield self
+        finally:
+            try:
+                self.__flush_batch()
+            finally:
+                self._batch = None
+
     def clear(self, rgb=Palette.BLACK):
         self.fill(rgb)
 
@@ -158,14 +344,27 @@ class Pixoo:
             'Command' : 'Draw/ClearHttpText'
         })
 
+    def close(self):
+        if self.__transport is not None:
+            self.__transport.close()
+            self.__session.close()
+
+    def connect(self):
+        # Retrieve the counter
+        self.__load_counter()
+
+        # Retrieve current device configuration
+        self.update_config(force=True)
+
+        # Resetting if needed
+        if self.refresh_connection_automatically and self.__counter > self.__refresh_counter_limit:
+            self.__reset_counter()
+
+    def draw_circle(self, center_xy, radius, rgb=Palette.WHITE, filled=False):
+        self.draw_spans(circle_spans(center_xy, radius, filled), rgb)
+
     def draw_character(self, character, xy=(0, 0), rgb=Palette.WHITE):
-        matrix = retrieve_glyph(character)
-        if matrix is not None:
-            for index, bit in enumerate(matrix):
-                if bit == 1:
-                    local_x = index % 3
-                    local_y = int(index / 3)
-                    self.draw_pixel((xy[0] + local_x, xy[1] + local_y), rgb)
+        self.draw_mask(text_mask(character), xy, rgb)
 
     def draw_character_at_location_rgb(self, character, x=0, y=0, r=255, g=255,
                                        b=255):
@@ -173,9 +372,18 @@ class Pixoo:
 
     def draw_filled_rectangle(self, top_left_xy=(0, 0), bottom_right_xy=(1, 1),
                               rgb=Palette.BLACK):
-        for y in range(top_left_xy[1], bottom_right_xy[1] + 1):
-            for x in range(top_left_xy[0], bottom_right_xy[0] + 1):
-                self.draw_pixel((x, y), rgb)
+        # Clip the rectangle to the screen, then write it row by row
+        left = max(top_left_xy[0], 0)
+        right = min(bottom_right_xy[0], self.size - 1)
+        top = max(top_left_xy[1], 0)
+        bottom = min(bottom_right_xy[1], self.size - 1)
+        if left > right or top > bottom:
+            return
+
+        row = bytes(clamp_color(rgb)) * (right - left + 1)
+        for y in range(top, bottom + 1):
+            index = (left + y * self.size) * 3
+            self.__buffer[index:index + len(row)] = row
 
     def draw_filled_rectangle_from_top_left_to_bottom_right_rgb(self,
                                                                 top_left_x=0,
@@ -193,69 +401,70 @@ class Pixoo:
                                                    Image.Image) else Image.open(
             image_path_or_object)
         size = image.size
-        width = size[0]
-        height = size[1]
-
-        # See if it needs to be scaled/resized to fit the display
-        if width > self.size or height > self.size:
-            if pad_resample:
-                image = ImageOps.pad(image, (self.size, self.size),
-                                     image_resample_mode)
-            else:
-                image.thumbnail((self.size, self.size), image_resample_mode)
 
-            if self.debug:
-                print(
-                    f'[.] Resized image to fit on screen (saving aspect ratio): "{image_path_or_object}" ({width}, {height}) '
-                    f'-> ({image.size[0]}, {image.size[1]})')
+        # Scale it to fit the display and convert it to RGB
+        rgb_image = fit_image(image, self.size, image_resample_mode, pad_resample)
+
+        if self.debug and rgb_image.size != size:
+            print(
+                f'[.] Resized image to fit on screen (saving aspect ratio): "{image_path_or_object}" ({size[0]}, {size[1]}) '
+                f'-> ({rgb_image.size[0]}, {rgb_image.size[1]})')
 
-        # Convert the loaded image to RGB
-        rgb_image = image.convert('RGB')
+        # Only the part that lands on the screen needs to be copied
+        left = max(-xy[0], 0)
+        top = max(-xy[1], 0)
+        right = min(rgb_image.size[0], self.size - xy[0])
+        bottom = min(rgb_image.size[1], self.size - xy[1])
+        if left >= right or top >= bottom:
+            return
 
-        # Iterate over all pixels in the image that are left and buffer them
-        for y in range(image.size[1]):
-            for x in range(image.size[0]):
-                location = (x, y)
-                placed_x = x + xy[0]
-                if self.size - 1 < placed_x or placed_x < 0:
-                    continue
+        if (left, top, right, bottom) != (0, 0) + rgb_image.size:
+            rgb_image = rgb_image.crop((left, top, right, bottom))
 
-                placed_y = y + xy[1]
-                if self.size - 1 < placed_y or placed_y < 0:
-                    continue
+        self.draw_rgb_bytes(rgb_image.tobytes(), rgb_image.size,
+                            (xy[0] + left, xy[1] + top))
 
-                self.draw_pixel((placed_x, placed_y),
-                                rgb_image.getpixel(location))
+    def draw_image_from_url(self, image_url, xy=(0, 0),
+                            image_resample_mode=ImageResampleMode.PIXEL_ART,
+                            pad_resample=False):
+        (width, height), data = self.__url_frame(image_url, image_resample_mode, pad_resample)
+        self.draw_rgb_bytes(data, (width, height), xy)
 
     def draw_image_at_location(self, image_path_or_object, x, y,
                                image_resample_mode=ImageResampleMode.PIXEL_ART):
         self.draw_image(image_path_or_object, (x, y), image_resample_mode)
 
     def draw_line(self, start_xy, stop_xy, rgb=Palette.WHITE):
-        line = set()
-
-        # Calculate the amount of steps needed between the points to draw a nice line
-        amount_of_steps = minimum_amount_of_steps(start_xy, stop_xy)
-
-        # Iterate over them and create a nice set of pixels
-        for step in range(amount_of_steps):
-            if amount_of_steps == 0:
-                interpolant = 0
-            else:
-                interpolant = step / amount_of_steps
-
-            # Add a pixel as a rounded location
-            line.add(
-                round_location(lerp_location(start_xy, stop_xy, interpolant)))
-
-        # Draw the actual pixel line
-        for pixel in line:
-            self.draw_pixel(pixel, rgb)
+        self.draw_spans(line_spans(start_xy, stop_xy), rgb)
 
     def draw_line_from_start_to_stop_rgb(self, start_x, start_y, stop_x, stop_y,
                                          r=255, g=255, b=255):
         self.draw_line((start_x, start_y), (stop_x, stop_y), (r, g, b))
 
+    def draw_mask(self, mask, xy=(0, 0), rgb=Palette.WHITE):
+        # Draw a (width, rows) mask like text_mask returns in one color. The
+        # clipping is worked out once, then every row is blended as a whole.
+        width, rows = mask
+        top = max(-xy[1], 0)
+        bottom = min(len(rows), self.size - xy[1])
+        left = max(-xy[0], 0)
+        right = min(width, self.size - xy[0])
+        if top >= bottom or left >= right:
+            return
+
+        length = (right - left) * 3
+        shift = (width - right) * 24
+        visible = (1 << length * 8) - 1
+        color = int.from_bytes(bytes(clamp_color(rgb)) * (right - left), 'big')
+        for y in range(top, bottom):
+            row = (rows[y] >> shift) & visible
+            if not row:
+                continue
+
+            index = ((xy[1] + y) * self.size + xy[0] + left) * 3
+            pixels = int.from_bytes(self.__buffer[index:index + length], 'big')
+            self.__buffer[index:index + length] = ((pixels & ~row) | (color & row)).to_bytes(length, 'big')
+
     def draw_pixel(self, xy, rgb):
         # If it's not on the screen, we're not going to bother
         if xy[0] < 0 or xy[0] >= self.size or xy[1] < 0 or xy[1] >= self.size:
@@ -278,15 +487,9 @@ class Pixoo:
                 print(f'[!] Invalid index given: {index} (maximum index is {self.pixel_count - 1})')
             return
 
-        # Clamp the color, just to be safe
-        rgb = clamp_color(rgb)
-
-        # Move to place in array
+        # Clamp the color, just to be safe, and write it in one go
         index = index * 3
-
-        self.__buffer[index] = rgb[0]
-        self.__buffer[index + 1] = rgb[1]
-        self.__buffer[index + 2] = rgb[2]
+        self.__buffer[index:index + 3] = bytes(clamp_color(rgb))
 
     def draw_pixel_at_index_rgb(self, index, r, g, b):
         self.draw_pixel_at_index(index, (r, g, b))
@@ -294,51 +497,119 @@ class Pixoo:
     def draw_pixel_at_location_rgb(self, x, y, r, g, b):
         self.draw_pixel((x, y), (r, g, b))
 
-    def draw_text(self, text, xy=(0, 0), rgb=Palette.WHITE):
-        for index, character in enumerate(text):
-            self.draw_character(character, (index * 4 + xy[0], xy[1]), rgb)
+    def draw_polygon(self, points, rgb=Palette.WHITE):
+        self.draw_spans(polygon_spans(points), rgb)
+
+    def draw_polyline(self, points, rgb=Palette.WHITE, closed=False):
+        self.draw_spans(polyline_spans(points, closed), rgb)
+
+    def draw_rgb_bytes(self, data, size, xy=(0, 0)):
+        # Blit raw RGB data (row-major, 3 bytes per pixel) of the given
+        # (width, height) into the buffer, clipped to the screen
+        width, height = size
+        left = max(-xy[0], 0)
+        top = max(-xy[1], 0)
+        right = min(width, self.size - xy[0])
+        bottom = min(height, self.size - xy[1])
+        if left >= right or top >= bottom:
+            return
+
+        data = memoryview(data)
+        target = ((xy[1] + top) * self.size + xy[0] + left) * 3
+
+        # Full rows can be copied as one contiguous block
+        if left == 0 and right == width == self.size:
+            source = top * width * 3
+            length = (bottom - top) * width * 3
+            self.__buffer[target:target + length] = data[source:source + length]
+            return
+
+        row_length = (right - left) * 3
+        for y in range(top, bottom):
+            source = (y * width + left) * 3
+            self.__buffer[target:target + row_length] = data[source:source + row_length]
+            target += self.size * 3
+
+    def draw_shapes(self, shapes):
+        # Draw many shapes in one go, shapes being (spans, rgb) pairs with
+        # spans from shapes.py. The color rows are only built once.
+        lines = {}
+        for spans, rgb in shapes:
+            rgb = tuple(clamp_color(rgb))
+            line = lines.get(rgb)
+            if line is None:
+                line = lines[rgb] = bytes(rgb) * self.size
+            self.__fill_spans(spans, line)
+
+    def draw_spans(self, spans, rgb=Palette.WHITE):
+        # Fill (y, first x, last x) spans, clipped to the screen
+        self.__fill_spans(spans, bytes(clamp_color(rgb)) * self.size)
+
+    def draw_text(self, text, xy=(0, 0), rgb=Palette.WHITE, font=None):
+        # font is an optional TextRenderer (see text.py), its text is wrapped
+        # to the rest of the screen. Without one, the built-in PICO-8 font
+        # is used.
+        if font is not None:
+            self.draw_mask(font.render(text, self.size - max(xy[0], 0)), xy, rgb)
+            return
+
+        self.draw_mask(text_mask(text), xy, rgb)
 
     def draw_text_at_location_rgb(self, text, x, y, r, g, b):
         self.draw_text(text, (x, y), (r, g, b))
 
+    def flush_batch(self):
+        self.__flush_batch()
+
     def fill(self, rgb=Palette.BLACK):
-        self.__buffer = []
-        rgb = clamp_color(rgb)
-        for index in range(self.pixel_count):
-            self.__buffer.extend(rgb)
+        # Overwrite the preallocated buffer in place
+        self.__buffer[:] = bytes(clamp_color(rgb)) * self.pixel_count
 
     def fill_rgb(self, r, g, b):
         self.fill((r, g, b))
 
     def get_current_channel(self):
-        response = requests.post(self.__url, json.dumps({
+        return self.__post({
             'Command': 'Channel/GetIndex'
-            }))
-        return response.json()
+        })
 
     def get_device_time(self):
-        response = requests.post(self.__url, json.dumps({
+        return self.__post({
             'Command': 'Device/GetDeviceTime'
-            }))
-        return response.json()
+        })
 
     def get_face_id(self):
-        response = requests.post(self.__url, json.dumps({
+        return self.__post({
             'Command': 'Channel/GetClockInfo'
-            }))
-        return response.json()
+        })
 
     def get_weather_info(self):
-        response = requests.post(self.__url, json.dumps({
+        return self.__post({
             'Command': 'Device/GetWeatherInfo'
-            }))
-        return response.json()
+        })
 
-    def play_buzzer(self, active_time, off_time, total_time):
-        # This won't be possible
-        if self.simulated:
-            return
+    def invalidate_config(self):
+        # Make the next update_config ask the device again
+        self.__config_expires = 0
+
+    def invalidate_frame(self):
+        # Forget which frame the device shows, so the next push is sent
+        self.__last_frame_digest = None
+
+    @contextlib.contextmanager
+    def layer(self, name):
+        # Everything drawn inside this block goes to the layer instead of
+        # the frame buffer, only the layer is blended again on the next push
+        layer = self.__layers[name]
+        buffer = self.__buffer
+        self.__buffer = layer.buffer
+        try:
+            yield layer
+        finally:
+            self.__buffer = buffer
+            layer.dirty = True
 
+    def play_buzzer(self, active_time, off_time, total_time):
         self.__send_request({
             'Command': 'Device/PlayBuzzer',
             'ActiveTimeInCycle': active_time,
@@ -348,10 +619,6 @@ class Pixoo:
 
     def play_divoom_gif(self, file_id=''):
         # file_id needs to be determined from img upload list (see helpers.py)
-        # This won't be possible
-        if self.simulated:
-            return
-
         self.__send_request({
             'Command': 'Draw/SendRemote',
             'FileId': file_id
@@ -366,20 +633,42 @@ class Pixoo:
             'FileName': file_name
         })
 
-    def push(self, reload_counter=False):
+    def push(self, reload_counter=False, force=False):
+        # Don't bother the device with a frame it is already showing
+        frame = self.__buffer
+        if self.__layers:
+            start = time.perf_counter()
+            frame = self.__compositor.compose(frame, self.layers)
+            self.metrics.record_timing('render', time.perf_counter() - start)
+        digest = frame_digest(frame)
+        if not force and digest == self.__last_frame_digest:
+            self.__frames_skipped = self.__frames_skipped + 1
+            if self.debug:
+                print(f'[.] Frame unchanged, skipped {self.__frames_skipped} pushes')
+            return
+
         if reload_counter:
             self.__load_counter()
-        self.__send_buffer()
-
-    def send_animation(self, pic_list, pic_speed=1000, reload_counter=False):
+        if self.__send_buffer(digest=digest, frame=frame):
+            self.__last_frame_digest = digest
+
+    def remove_layer(self, name):
+        self.__layers.pop(name, None)
+
+    def send_animation(self, pic_list, pic_speed=1000, reload_counter=False, frame_count=None):
+        # pic_list can be any iterable of images, paths or ((width, height),
+        # RGB bytes) frames, frame_count is required when it has no length
+        # (like a generator). pic_speed is either one speed for all frames or
+        # a list with one per frame.
+        if frame_count is None:
+            frame_count = len(pic_list)
         if reload_counter:
             self.__load_counter()
-        pic_num = len(pic_list)
-        update_counter = True
-        for pic_offset, pic in enumerate(pic_list):
-            self.draw_image(pic)
-            self.__send_buffer(pic_num, pic_offset, pic_speed, update_counter)
-            update_counter = False
+
+        # The next frames are decoded while this one is being uploaded
+        with FramePrefetcher(pic_list, self._rasterize_frame, frame_count) as frames:
+            for pic_offset, (frame, speed) in enumerate(zip(frames, _pic_speeds(pic_speed))):
+                self._send_frame(frame, frame_count, pic_offset, speed, pic_offset == 0)
 
     def send_command_list(self, clear_list=True):
         request = {
@@ -410,10 +699,6 @@ class Pixoo:
     def send_text(self, text, xy=(0, 0), color=Palette.WHITE, identifier=1, font=2, width=64,
                   movement_speed=0, direction=TextScrollDirection.LEFT, align=1,
                   gather_command=False):
-        # This won't be possible
-        if self.simulated:
-            return
-
         # Make sure the identifier is valid
         identifier = clamp(identifier, 0, 19)
 
@@ -432,10 +717,6 @@ class Pixoo:
         }, gather_command)
 
     def set_brightness(self, brightness, gather_command=False):
-        # This won't be possible
-        if self.simulated:
-            return
-
         brightness = clamp(brightness, 0, 100)
         self.__send_request({
             'Command': 'Channel/SetBrightness',
@@ -443,43 +724,24 @@ class Pixoo:
         }, gather_command)
 
     def set_channel(self, channel, gather_command=False):
-        # This won't be possible
-        if self.simulated:
-            return
-
         self.__send_request({
             'Command': 'Channel/SetIndex',
             'SelectIndex': int(channel)
         }, gather_command)
-        data = response.json()
-        if data['error_code'] != 0:
-            self.__error(data)
-        
-    def set_clock(self, clock_id, gather_command=False):
-        # This won't be possible
-        if self.simulated:
-            return
 
+    def set_clock(self, clock_id, gather_command=False):
         self.__send_request({
             'Command': 'Channel/SetClockSelectId',
             'ClockId': clock_id
         }, gather_command)
 
     def set_cloud(self, cloud_id, gather_command=False):
-        # This won't be possible
-        if self.simulated:
-            return
-
         self.__send_request({
             'Command': 'Channel/CloudIndex',
             'Index': cloud_id
         }, gather_command)
 
     def set_countdown(self, status=1, minutes=1, seconds=1, gather_command=False):
-        # This won't be possible
-        if self.simulated:
-            return
-
         self.__send_request({
             'Command': 'Tools/SetTimer',
             'Minute' : minutes,
@@ -488,28 +750,20 @@ class Pixoo:
         }, gather_command)
 
     def set_custom_page(self, index, gather_command=False):
-        # This won't be possible
-        if self.simulated:
-            return
-
         self.__send_request({
             'Command': 'Channel/SetCustomPageIndex',
             'CustomPageIndex': index
         }, gather_command)
 
     def set_custom_channel(self, index, gather_command=False):
-        self.set_custom_page(index)
-        self.set_channel(3)
+        self.set_custom_page(index, gather_command)
+        self.set_channel(Channel.CUSTOM, gather_command)
         
     def set_face(self, face_id, gather_command=False):
         self.set_clock(face_id, gather_command)
 
     def set_high_light_mode(self, high_light_mode=0, gather_command=False):
         # 0:close; 1:open
-        # This won't be possible
-        if self.simulated:
-            return
-
         self.__send_request({
             'Command': 'Device/SetHighLightMode',
             'Mode': high_light_mode
@@ -517,10 +771,6 @@ class Pixoo:
 
     def set_hour_mode(self, time_flag=0, gather_command=False):
         # 1:24-hour; 0:12-hour
-        # This won't be possible
-        if self.simulated:
-            return
-
         self.__send_request({
             'Command': 'Device/SetTime24Flag',
             'Mode': time_flag
@@ -528,10 +778,6 @@ class Pixoo:
 
     def set_noise_status(self, noise_status, gather_command=False):
         # noise_status: 1:start; 0:stop
-        # This won't be possible
-        if self.simulated:
-            return
-
         self.__send_request({
             'Command': 'Tools/SetNoiseStatus',
             'NoiseStatus': noise_status
@@ -539,20 +785,12 @@ class Pixoo:
 
     def set_mirror_mode(self, mirror_mode=0, gather_command=False):
         # mirror_mode: 0:disable; 1:enalbe
-        # This won't be possible
-        if self.simulated:
-            return
-
         self.__send_request({
             'Command': 'Device/SetMirrorMode',
             'Mode': mirror_mode
         }, gather_command)
 
     def set_scoreboard(self, blue_score=0, red_score=0, gather_command=False):
-        # This won't be possible
-        if self.simulated:
-            return
-
         self.blue_score = blue_score
         self.red_score = red_score
         self.__send_request({
@@ -562,20 +800,12 @@ class Pixoo:
         }, gather_command)
 
     def set_stopwatch(self, status, gather_command=False):
-        # This won't be possible
-        if self.simulated:
-            return
-
         self.__send_request({
             'Command' : 'Tools/SetStopWatch',
             'Status' : status
         }, gather_command)
 
     def set_screen(self, on=True, gather_command=False):
-        # This won't be possible
-        if self.simulated:
-            return
-
         self.__send_request({
             'Command': 'Channel/OnOffScreen',
             'OnOff': 1 if on else 0
@@ -583,10 +813,6 @@ class Pixoo:
 
     def set_screen_rotation(self, rotation=0, gather_command=False):
         # rotation_angle: 0:normal, 1:90; 2:180; 3:270 (degree)
-        # This won't be possible
-        if self.simulated:
-            return
-
         self.__send_request({
             'Command': 'Device/SetScreenRotationAngle',
             'Mode': rotation
@@ -600,9 +826,6 @@ class Pixoo:
 
     def set_system_time(self, system_time, gather_command=False):
         # This will set the system time in unix format (seconds since January 1st 1970)
-        if self.simulated:
-            return
-
         self.__send_request({
             'Command': 'Device/SetUTC',
             'Utc': system_time
@@ -610,30 +833,18 @@ class Pixoo:
 
     def set_temperature_mode(self, temperature_mode=0, gather_command=False):
         # temperature_mode: 0:Celsius; 1:Fahrenheit
-        # This won't be possible
-        if self.simulated:
-            return
-
         self.__send_request({
             'Command': 'Device/SetDisTempMode',
             'Mode': temperature_mode
         }, gather_command)
 
     def set_time_zone(self, time_zone='GMT+1', gather_command=False):
-        # This won't be possible
-        if self.simulated:
-            return
-
         self.__send_request({
             'Command': 'Sys/TimeZone',
             'TimeZoneValue': time_zone
         }, gather_command)
 
     def set_visualizer(self, equalizer_position, gather_command=False):
-        # This won't be possible
-        if self.simulated:
-            return
-
         self.__send_request({
             'Command': 'Channel/SetEqPosition',
             'EqPosition': equalizer_position
@@ -641,10 +852,6 @@ class Pixoo:
 
     def set_weather_location(self, longitude=0.0, latitude=0.0, gather_command=False):
         # longitude and latitude in degree decimal
-        # This won't be possible
-        if self.simulated:
-            return
-
         self.__send_request({
             'Command': 'Sys/LogAndLat',
             'Longitude': longitude,
@@ -653,10 +860,6 @@ class Pixoo:
 
     def set_white_balance(self, r, g, b, gather_command=False):
         # Range for r, g, b: 0:100
-        # This won't be possible
-        if self.simulated:
-            return
-
         self.__send_request({
             'Command': 'Device/SetWhiteBalance',
             'RValue': r,
@@ -669,8 +872,8 @@ class Pixoo:
         self.push()
 
     def show_image_from_url(self, image_url, **kwargs):
-        image = url_image_handle(image_url)
-        self.show_image(image, **kwargs)
+        self.draw_image_from_url(image_url, **kwargs)
+        self.push()
 
     def show_albumart(self, image):
         """
@@ -681,31 +884,47 @@ class Pixoo:
     def show_albumart_from_url(self, image):
         self.show_image_from_url(image, pad_resample=True)
 
-    def show_album_and_artist(self, image_path, artist, album, track):
+    def show_album_and_artist(self, image_path, artist, album, track, duration=30):
         """
         Displays album art and artist information.
         """
         try:
-            org_image = Image.open(image_path)
+            org_image = image_path if isinstance(image_path, Image.Image) else Image.open(image_path)
         except UnidentifiedImageError:
             if self.debug:
                 print("No image found")
             return
 
-        image = ImageOps.pad(org_image, (64, 64), Image.NEAREST)
-        overlay = Image.new(image.mode, image.size)
-        mask = Image.new('L', image.size, 255)
-        draw = ImageDraw.Draw(mask)
-        draw.rectangle((0,32,64,64), fill=128)
-        image = Image.composite(image, overlay, mask)
-        self.show_albumart(image)
+        self.show_albumart(album_art_overlay(org_image))
         time.sleep(.5)
         self.show_artist_info(artist, album, track)
-        time.sleep(30)
+        time.sleep(duration)
         self.show_albumart(org_image)
 
-    def show_album_and_artist_from_url(self, image_path, artist, album, track):
-        self.show_album_and_artist(url_image_handle(image_path), artist, album, track)
+    def show_album_and_artist_from_url(self, image_path, artist, album, track, duration=30):
+        try:
+            (width, height), data = self.__url_frame(image_path, ImageResampleMode.PIXEL_ART, True)
+        except UnidentifiedImageError:
+            if self.debug:
+                print("No image found")
+            return
+
+        image = Image.frombytes('RGB', (width, height), data)
+        self.show_album_and_artist(image, artist, album, track, duration)
+
+    def show_animation(self, image_path_or_object, image_resample_mode=ImageResampleMode.PIXEL_ART,
+                       pad_resample=False, tolerance=2, max_frames=MAX_ANIMATION_FRAMES):
+        """
+        Plays an animated GIF, APNG or WebP with the timing of its frames.
+        """
+        pic_list, pic_speeds = self._prepare_animation(
+            image_path_or_object, image_resample_mode, pad_resample, tolerance, max_frames)
+        self.send_animation(pic_list, pic_speeds)
+
+    def show_animation_from_url(self, image_url, **kwargs):
+        # Decoding the frames needs to seek, so it can't use a raw stream
+        response = self.__session.get(image_url, timeout=self.__timeout)
+        self.show_animation(io.BytesIO(response.content), **kwargs)
 
     def show_artist_info(self, artist, album, track):
         """
@@ -717,48 +936,207 @@ class Pixoo:
             text='{0}'.format(track), movement_speed=100, xy=(1,48), width=62, identifier=2)
         self.send_display_list()
 
+    def show_frames(self, frames, pic_speed=1000):
+        # Frames that are ready for the device, as ((width, height), RGB
+        # bytes) like MediaLibrary.load returns them. One frame is pushed as
+        # a still image, more are sent as an animation.
+        if len(frames) == 1:
+            (size, data), = frames
+            self.draw_rgb_bytes(data, size)
+            self.push()
+            return
+
+        for pic_offset, (frame, speed) in enumerate(zip(frames, _pic_speeds(pic_speed))):
+            self._send_frame(frame, len(frames), pic_offset, speed, pic_offset == 0)
+
     def turn_on(self):
         self.set_screen(True)
         
     def turn_off(self):
         self.set_screen(False)
 
-    def update_config(self):
-        self.device_config = self.__get_config()
-        
+    def update_config(self, force=False):
+        if force or not self._config_is_fresh():
+            self.device_config = self.__get_config()
+
+
     def update_score(self):
         self.set_scoreboard(self.blue_score, self.red_score)
 
+    def _config_is_fresh(self):
+        return time.monotonic() < self.__config_expires
+
+    def _prepare_animation(self, image_path_or_object, image_resample_mode=ImageResampleMode.PIXEL_ART,
+                           pad_resample=False, tolerance=2, max_frames=MAX_ANIMATION_FRAMES):
+        image = image_path_or_object if isinstance(image_path_or_object,
+                                                   Image.Image) else Image.open(
+            image_path_or_object)
+        frames = decode_animation(image, self.size, image_resample_mode, pad_resample, tolerance, max_frames)
+
+        if self.debug:
+            print(f'[.] Animation reduced to {len(frames)} frames')
+
+        return [frame for frame, _ in frames], [speed for _, speed in frames]
+
+    def _open_transport(self, pool_size):
+        # Keep the connection to the device alive between requests
+        self.__session = requests.Session()
+        self.__session.mount('http://{0}/'.format(self.address), requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size))
+
+        # Requests to the device are retried and given up on in time
+        self.__transport = Transport(self.__url, self.__session, *self.__timeout)
+
+    def _rasterize_frame(self, image_path_or_object,
+                         image_resample_mode=ImageResampleMode.PIXEL_ART,
+                         pad_resample=False):
+        # Turn an animation frame into ((width, height), RGB bytes) without
+        # touching the buffer, so it can be done in another thread. Frames
+        # from a FrameStore or MediaLibrary are like that already.
+        if isinstance(image_path_or_object, tuple):
+            return image_path_or_object
+
+        start = time.perf_counter()
+        image = image_path_or_object if isinstance(image_path_or_object,
+                                                   Image.Image) else Image.open(
+            image_path_or_object)
+        rgb_image = fit_image(image, self.size, image_resample_mode, pad_resample)
+        frame = rgb_image.size, rgb_image.tobytes()
+        self.metrics.record_timing('render', time.perf_counter() - start)
+        return frame
+
+    def _send_frame(self, frame, pic_num, pic_offset, pic_speed, update_counter):
+        size, data = frame
+        self.draw_rgb_bytes(data, size)
+        return self.__send_buffer(pic_num, pic_offset, pic_speed, update_counter)
+
+    def _update_counter(self, data):
+        # Store the counter from a Draw/GetHttpGifId response
+        if data['error_code'] != 0:
+            self.__error(data)
+
+            # Carry on from the start rather than asking again on every push
+            if self.__counter is None:
+                self.__counter = 0
+        else:
+            self.__counter = int(data['PicId'])
+            if self.debug:
+                print('[.] Counter loaded and stored: ' + str(self.__counter))
+
     def __clamp_location(self, xy):
         return clamp(xy[0], 0, self.size - 1), clamp(xy[1], 0, self.size - 1)
 
+    def __deliver(self, request_dict):
+        data = self.__post(request_dict)
+        if data['error_code'] != 0:
+            if request_dict['Command'] == 'Draw/CommandList':
+                # The device only tells us the list failed, so send the
+                # commands that can be repeated one by one to find out which
+                # of them it rejects. Others may have been carried out already
+                commands = request_dict['CommandList']
+                for command in commands:
+                    if is_idempotent(command):
+                        self.__deliver(command)
+                if not all(is_idempotent(command) for command in commands):
+                    self.__error(data)
+            else:
+                self.__error(data)
+
     def __error(self, error):
         if self.debug:
             print('[x] Error on request ' + str(self.__counter))
             print(error)
 
+    def __fill_spans(self, spans, line):
+        # line is the color repeated for the width of the screen
+        size = self.size
+        buffer = self.__buffer
+        for y, left, right in spans:
+            if y < 0 or y >= size:
+                continue
+            if left < 0:
+                left = 0
+            if right >= size:
+                right = size - 1
+            if left <= right:
+                index = (y * size + left) * 3
+                buffer[index:index + (right - left + 1) * 3] = line[:(right - left + 1) * 3]
+
+    def __flush_batch(self):
+        # Send the commands collected so far, a single one doesn't need a list
+        commands = self._batch
+        if not commands:
+            return
+
+        self._batch = []
+        if len(commands) == 1:
+            self.__deliver(commands[0])
+        else:
+            self.__deliver({
+                'Command': 'Draw/CommandList',
+                'CommandList': commands
+            })
+
     def __get_config(self):
-        response = requests.post(self.__url, json.dumps({
+        return self.__post({
             'Command': 'Channel/GetAllConf'
-        }))
-        return response.json()
+        })
  
     def __load_counter(self):
-        # Just assume it's starting at the beginning if we're simulating
-        if self.simulated:
-            self.__counter = 1
-            return
+        self._update_counter(self.__post({
+            'Command': 'Draw/GetHttpGifId'
+        }))
 
-        response = requests.post(self.__url, '{"Command": "Draw/GetHttpGifId"}')
-        data = response.json()
-        if data['error_code'] != 0:
-            self.__error(data)
-        else:
-            self.__counter = int(data['PicId'])
-            if self.debug:
-                print('[.] Counter loaded and stored: ' + str(self.__counter))
+    def __url_frame(self, image_url, image_resample_mode, pad_resample):
+        # Downloading and scaling the same album art over and over is a waste
+        key = FrameCache.key(image_url, self.size, image_resample_mode, pad_resample)
+        frame = self.frame_cache.get(key) if self.frame_cache is not None else None
+        if frame is not None:
+            return frame
+
+        image = fit_image(Image.open(url_image_handle(image_url, self.__session, self.__timeout)), self.size,
+                          image_resample_mode, pad_resample)
+        if self.frame_cache is None:
+            return image.size, image.tobytes()
+        return self.frame_cache.put(key, image.size, image.tobytes())
+
+    def __post(self, request_dict, body=None):
+        # body is the request already encoded, see encode_frame_request
+        if self._deferred_requests is not None:
+            self._deferred_requests.append((request_dict, body))
+            return {'error_code': 0}
+
+        if body is None:
+            body = json.dumps(request_dict)
+        start = time.perf_counter()
+        try:
+            # A simulated client never reaches the network
+            if self.simulated:
+                data = self.__simulator.post(body)
+            else:
+                data = self.__transport.post(request_dict, body)
+        except Exception as ex:
+            self.metrics.record_request(request_dict['Command'], time.perf_counter() - start, len(body),
+                                        type(ex).__name__)
+            raise
+        self.metrics.record_request(request_dict['Command'], time.perf_counter() - start, len(body),
+                                    data['error_code'])
+        return data
+
+    def __send_buffer(self, pic_num=1, pic_offset=0, pic_speed=1000, update_counter=True, digest=None, frame=None):
+        # frame is sent instead of the frame buffer when given (the layers
+        # composited over it)
+
+        # Commands issued before this frame have to reach the device first
+        self.__flush_batch()
+
+        # Whatever was on the screen before is about to be replaced
+        self.invalidate_frame()
+
+        # The counter is retrieved on the first push
+        if self.__counter is None:
+            self.__load_counter()
 
-    def __send_buffer(self, pic_num=1, pic_offset=0, pic_speed=1000, update_counter=True):
         # Add to the internal counter
         if update_counter:
             self.__counter = self.__counter + 1
@@ -771,55 +1149,64 @@ class Pixoo:
         if self.debug:
             print(f'[.] Counter set to {self.__counter}')
 
-        # If it's simulated, we don't need to actually push it to the divoom
-        if self.simulated:
-#            self.__simulator.display(self.__buffer, self.__counter)
-
-            # Simulate this too I suppose
-            self.__buffers_send = self.__buffers_send + 1
-            return
-
-        # Encode the buffer to base64 encoding
-        response = requests.post(self.__url, json.dumps({
+        # Encode the buffer to base64 encoding, unless we did that before
+        if frame is None:
+            frame = self.__buffer
+        if digest is None:
+            digest = frame_digest(frame)
+        request_dict = {
             'Command': 'Draw/SendHttpGif',
             'PicNum': pic_num,
             'PicWidth': self.size,
             'PicOffset': pic_offset,
             'PicID': self.__counter,
-            'PicSpeed': pic_speed,
-            'PicData': str(base64.b64encode(bytearray(self.__buffer)).decode())
-        }))
-        data = response.json()
+            'PicSpeed': pic_speed
+        }
+        start = time.perf_counter()
+        pic_data = self.pic_data_cache.encode(digest, frame)
+        body = encode_frame_request(request_dict, pic_data)
+        self.metrics.record_timing('encode', time.perf_counter() - start)
+        data = self.__post(request_dict, body)
         if data['error_code'] != 0:
             self.__error(data)
-        else:
-            self.__buffers_send = self.__buffers_send + 1
+            return False
 
-            if self.debug:
-                print(f'[.] Pushed {self.__buffers_send} buffers')
+        self.__buffers_send = self.__buffers_send + 1
+
+        if self.debug:
+            print(f'[.] Pushed {self.__buffers_send} buffers')
+
+        return True
 
     def __send_request(self, request_dict, gather_command=False):
         if gather_command:
             self.add_command(request_dict)
             return
 
-        response = requests.post(self.__url, json.dumps(request_dict))
-        data = response.json()
-        if data['error_code'] != 0:
-            self.__error(data)
+        if not preserves_frame(request_dict):
+            self.invalidate_frame()
+
+        # The configuration we have is about to be outdated
+        self.invalidate_config()
+
+        # Hold on to it until the batch is done
+        if self._batch is not None:
+            if request_dict['Command'] == 'Draw/CommandList':
+                self._batch.extend(request_dict['CommandList'])
+            else:
+                self._batch.append(request_dict)
+            return
+
+        self.__deliver(request_dict)
 
     def __reset_counter(self):
         if self.debug:
             print(f'[.] Resetting counter remotely')
 
-        # This won't be possible
-        if self.simulated:
-            return
-
-        response = requests.post(self.__url, json.dumps({
+        self.invalidate_frame()
+        data = self.__post({
             'Command': 'Draw/ResetHttpGifId'
-        }))
-        data = response.json()
+        })
         if data['error_code'] != 0:
             self.__error(data)
 
@@ -1,3 +1,5 @@
+import functools
+
 FONT_PICO_8 = {'0': [1, 1, 1, 1, 0, 1, 1, 0, 1, 1, 0, 1, 1, 1, 1], '1': [1, 1, 0, 0, 1, 0, 0, 1, 0, 0, 1, 0, 1, 1, 1],
                '2': [1, 1, 1, 0, 0, 1, 1, 1, 1, 1, 0, 0, 1, 1, 1], '3': [1, 1, 1, 0, 0, 1, 0, 1, 1, 0, 0, 1, 1, 1, 1],
                '4': [1, 0, 1, 1, 0, 1, 1, 1, 1, 0, 0, 1, 0, 0, 1], '5': [1, 1, 1, 1, 0, 0, 1, 1, 1, 0, 0, 1, 1, 1, 1],
@@ -46,6 +48,47 @@ FONT_PICO_8 = {'0': [1, 1, 1, 1, 0, 1, 1, 0, 1, 1, 0, 1, 1, 1, 1], '1': [1, 1, 0
                }
 
 
+# Glyphs are 3 pixels wide and 5 high, characters are 4 pixels apart
+GLYPH_WIDTH = 3
+GLYPH_HEIGHT = 5
+GLYPH_ADVANCE = 4
+
+
+def _compile_glyph(matrix):
+    # Turn the row-major list of bits into one bitmask per row, the leftmost
+    # pixel being the highest bit
+    matrix = matrix + [0] * (GLYPH_WIDTH * GLYPH_HEIGHT - len(matrix))
+    return tuple(
+        sum(bit << (GLYPH_WIDTH - 1 - x) for x, bit in enumerate(matrix[y * GLYPH_WIDTH:(y + 1) * GLYPH_WIDTH]))
+        for y in range(GLYPH_HEIGHT))
+
+
+GLYPH_ROWS = {character: _compile_glyph(matrix) for character, matrix in FONT_PICO_8.items()}
+
+# Every row bitmask of a glyph, including the gap after it, as 3 bytes per pixel
+_PIXEL_MASKS = tuple(
+    sum(0xFFFFFF << (24 * (GLYPH_ADVANCE - 1 - x)) for x in range(GLYPH_WIDTH) if bits & (1 << (GLYPH_WIDTH - 1 - x)))
+    for bits in range(1 << GLYPH_WIDTH))
+_BLANK = (0,) * GLYPH_HEIGHT
+
+
+@functools.lru_cache(maxsize=256)
+def text_mask(text):
+    # Render text once into a mask: its width in pixels and one integer per
+    # row that has 0xFFFFFF for every lit pixel, the leftmost pixel in the
+    # highest bits. Pixoo.draw_mask blends a whole row at once with that.
+    # Labels that are drawn over and over, like scores and clocks, come
+    # straight from the cache.
+    width = max(len(text) * GLYPH_ADVANCE - 1, 0)
+    rows = []
+    for y in range(GLYPH_HEIGHT):
+        row = 0
+        for character in text:
+            row = (row << GLYPH_ADVANCE * 24) | _PIXEL_MASKS[GLYPH_ROWS.get(character, _BLANK)[y]]
+        rows.append(row >> 24)
+    return width, tuple(rows)
+
+
 def retrieve_glyph(character):
     if character in FONT_PICO_8:
         return FONT_PICO_8[character]
@@ -57,4 +100,4 @@ def supported_characters():
     return FONT_PICO_8.keys()
 
 
-__all__ = (retrieve_glyph, supported_characters, FONT_PICO_8)
+__all__ = (retrieve_glyph, supported_characters, text_mask, FONT_PICO_8, GLYPH_ROWS)
@@ -0,0 +1,138 @@
+import asyncio
+import collections
+import concurrent.futures
+
+from PIL import ImageChops, ImageStat
+
+# PicNum has to stay below 60
+MAX_ANIMATION_FRAMES = 59
+
+# Frame durations (ms) we pass on as PicSpeed, outside of these the device
+# either can't keep up or appears to hang
+MIN_PIC_SPEED = 20
+MAX_PIC_SPEED = 10000
+
+# Browsers show GIF frames without a usable duration for this long
+DEFAULT_FRAME_DURATION = 100
+
+
+def collapse_frames(frames, tolerance=2):
+    # Merge consecutive (image, duration) frames that look the same, adding
+    # up their durations. Images are compared to the first one of a run, so
+    # slow fades don't disappear, tolerance is the largest mean difference
+    # per channel (0-255) that still counts as the same.
+    current = None
+    for image, duration in frames:
+        if current is not None and _frame_difference(current[0], image) <= tolerance:
+            current[1] = current[1] + duration
+            continue
+
+        if current is not None:
+            yield tuple(current)
+        current = [image, duration]
+
+    if current is not None:
+        yield tuple(current)
+
+
+def frame_duration(info):
+    # Duration of a decoded frame in ms, from its info dictionary
+    duration = info.get('duration')
+    if not duration or duration <= 10:
+        return DEFAULT_FRAME_DURATION
+    return duration
+
+
+def limit_frames(frames, max_frames=MAX_ANIMATION_FRAMES):
+    # Evenly drop frames from a list of (image, duration) that is too long,
+    # the ones that remain take over their durations
+    if len(frames) <= max_frames:
+        return frames
+
+    limited = []
+    for index in range(max_frames):
+        start = index * len(frames) // max_frames
+        stop = (index + 1) * len(frames) // max_frames
+        limited.append((frames[start][0], sum(duration for _, duration in frames[start:stop])))
+    return limited
+
+
+def pic_speed(duration):
+    return int(min(max(round(duration), MIN_PIC_SPEED), MAX_PIC_SPEED))
+
+
+def _frame_difference(first, second):
+    return max(ImageStat.Stat(ImageChops.difference(first, second)).mean)
+
+
+class FramePrefetcher:
+    """
+    Prepares the frames of an animation in a background thread, at most depth
+    frames ahead of the one that is being sent. The frames can come from any
+    iterable, including generators that decode them lazily, so only a few of
+    them are in memory at any time.
+    """
+
+    def __init__(self, frames, prepare, frame_count, depth=2):
+        self.frame_count = frame_count
+        self.depth = depth
+
+        self.__frames = iter(frames)
+        self.__prepare = prepare
+        self.__pending = collections.deque()
+        self.__submitted = 0
+
+        # A single worker, generators can't be advanced from several threads
+        self.__executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='pixoo-prefetch')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        # The frame being prepared isn't waited for, that would block the
+        # event loop. It only touches the frame it prepares.
+        self.close(wait=False)
+
+    def __iter__(self):
+        for _ in range(self.frame_count):
+            yield self.__next().result()
+
+    async def __aiter__(self):
+        for _ in range(self.frame_count):
+            yield await asyncio.wrap_future(self.__next())
+
+    def close(self, wait=True):
+        # Frames nobody is going to send don't need to be decoded
+        self.__executor.shutdown(wait=wait, cancel_futures=True)
+        self.__pending.clear()
+
+    def __fill(self):
+        while len(self.__pending) < self.depth and self.__submitted < self.frame_count:
+            self.__pending.append(self.__executor.submit(self.__prepare_next, self.__submitted))
+            self.__submitted = self.__submitted + 1
+
+    def __next(self):
+        self.__fill()
+        future = self.__pending.popleft()
+        self.__fill()
+        return future
+
+    def __prepare_next(self, index):
+        # Runs in the worker thread
+        try:
+            frame = next(self.__frames)
+        except StopIteration:
+            raise ValueError(
+                'Animation ended after {0} of {1} frames'.format(index, self.frame_count)) from None
+
+        return self.__prepare(frame)
+
+
+__all__ = (FramePrefetcher, collapse_frames, frame_duration, limit_frames, pic_speed)
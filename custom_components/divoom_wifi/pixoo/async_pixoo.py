@@ -0,0 +1,451 @@
+import asyncio
+import contextlib
+import contextvars
+import functools
+import io
+import json
+import logging
+import time
+
+import aiohttp
+from PIL import Image, UnidentifiedImageError
+
+from . import Channel, ImageResampleMode, Pixoo, _pic_speeds, album_art_overlay, fit_image
+from .animation import FramePrefetcher
+from .async_transport import AsyncTransport
+from .cache import FrameCache
+from .transport import is_idempotent
+
+_LOGGER = logging.getLogger(__name__)
+
+# The commands collected by the batches the current task has open, by client
+_batches = contextvars.ContextVar('pixoo_batches', default={})
+
+
+def _deferred(method):
+    # Run a Pixoo command without doing any I/O, then send the requests it
+    # produced from the event loop
+    @functools.wraps(method)
+    async def command(self, *args, **kwargs):
+        await self._run_deferred(functools.partial(method, self, *args, **kwargs))
+
+    return command
+
+
+class AsyncPixoo(Pixoo):
+    """
+    Pixoo client for asyncio applications like Home Assistant.
+    Drawing works exactly like on Pixoo, every method that talks to the
+    device is a coroutine and uses the given aiohttp session.
+    """
+
+    def __init__(self, address, session, size=64, debug=False, refresh_connection_automatically=True,
+                 simulated=False, connect_timeout=5, read_timeout=10, config_ttl=0, frame_cache=None,
+                 simulator=None):
+        super().__init__(address, size, debug, refresh_connection_automatically, simulated,
+                         connect_timeout=connect_timeout, read_timeout=read_timeout,
+                         connect=False, config_ttl=config_ttl, frame_cache=frame_cache, simulator=simulator)
+
+        # Pixoo would fetch the configuration lazily with blocking I/O,
+        # here it is filled in by connect() and update_config()
+        self.device_config = {}
+        self.invalidate_config()
+
+        self.__session = session
+        self.__url = 'http://{0}/post'.format(address)
+        self.__timeout = aiohttp.ClientTimeout(sock_connect=connect_timeout, sock_read=read_timeout)
+        self.__transport = AsyncTransport(self.__url, session, connect_timeout, read_timeout)
+
+        # Keeps the requests of concurrent commands in order
+        self.__lock = asyncio.Lock()
+
+        # The rest of the current album and artist overlay, and a number that
+        # tells whether a call to show_album_and_artist has been superseded
+        self.__album_timeline = None
+        self.__album_generation = 0
+
+    # Commands that only build requests can be reused as they are
+    clear_text = _deferred(Pixoo.clear_text)
+    flush_batch = _deferred(Pixoo.flush_batch)
+    play_buzzer = _deferred(Pixoo.play_buzzer)
+    play_divoom_gif = _deferred(Pixoo.play_divoom_gif)
+    play_gif = _deferred(Pixoo.play_gif)
+    send_command_file_list = _deferred(Pixoo.send_command_file_list)
+    send_command_list = _deferred(Pixoo.send_command_list)
+    send_display_list = _deferred(Pixoo.send_display_list)
+    send_text = _deferred(Pixoo.send_text)
+    set_brightness = _deferred(Pixoo.set_brightness)
+    set_channel = _deferred(Pixoo.set_channel)
+    set_clock = _deferred(Pixoo.set_clock)
+    set_cloud = _deferred(Pixoo.set_cloud)
+    set_countdown = _deferred(Pixoo.set_countdown)
+    set_custom_page = _deferred(Pixoo.set_custom_page)
+    set_high_light_mode = _deferred(Pixoo.set_high_light_mode)
+    set_hour_mode = _deferred(Pixoo.set_hour_mode)
+    set_mirror_mode = _deferred(Pixoo.set_mirror_mode)
+    set_noise_status = _deferred(Pixoo.set_noise_status)
+    set_scoreboard = _deferred(Pixoo.set_scoreboard)
+    set_screen = _deferred(Pixoo.set_screen)
+    set_screen_rotation = _deferred(Pixoo.set_screen_rotation)
+    set_stopwatch = _deferred(Pixoo.set_stopwatch)
+    set_system_time = _deferred(Pixoo.set_system_time)
+    set_temperature_mode = _deferred(Pixoo.set_temperature_mode)
+    set_time_zone = _deferred(Pixoo.set_time_zone)
+    set_visualizer = _deferred(Pixoo.set_visualizer)
+    set_weather_location = _deferred(Pixoo.set_weather_location)
+    set_white_balance = _deferred(Pixoo.set_white_balance)
+
+    @property
+    def transport(self):
+        return self.__transport
+
+    @contextlib.asynccontextmanager
+    async def batch(self):
+        # Only the commands of this task go in the batch, other coroutines
+        # keep sending theirs while it's open
+        batches = _batches.get()
+        if self in batches:
+            yield self
+            return
+
+        token = _batches.set({**batches, self: []})
+        try:
+            yield self
+        finally:
+            try:
+                await self._run_deferred(functools.partial(Pixoo.flush_batch, self))
+            finally:
+                _batches.reset(token)
+
+    async def close(self):
+        self.__cancel_album_timeline()
+        self.__transport.close()
+
+        # The aiohttp session is shared, it's up to its owner to close it
+        super().close()
+
+    async def connect(self):
+        await self.__load_counter()
+        await self.update_config(force=True)
+
+    async def draw_image_from_url(self, image_url, xy=(0, 0),
+                                  image_resample_mode=ImageResampleMode.PIXEL_ART,
+                                  pad_resample=False):
+        (width, height), data = await self.__url_frame(image_url, image_resample_mode, pad_resample)
+        self.draw_rgb_bytes(data, (width, height), xy)
+
+    async def get_current_channel(self):
+        return await self.__post({
+            'Command': 'Channel/GetIndex'
+        })
+
+    async def get_device_time(self):
+        return await self.__post({
+            'Command': 'Device/GetDeviceTime'
+        })
+
+    async def get_face_id(self):
+        return await self.__post({
+            'Command': 'Channel/GetClockInfo'
+        })
+
+    async def get_weather_info(self):
+        return await self.__post({
+            'Command': 'Device/GetWeatherInfo'
+        })
+
+    async def push(self, reload_counter=False, force=False):
+        if reload_counter or self.counter is None:
+            await self.__load_counter()
+        await self._run_deferred(functools.partial(Pixoo.push, self, force=force))
+
+    async def send_animation(self, pic_list, pic_speed=1000, reload_counter=False, frame_count=None):
+        if frame_count is None:
+            frame_count = len(pic_list)
+        if reload_counter or self.counter is None:
+            await self.__load_counter()
+
+        # Rasterizing the frames is CPU bound, so it happens in a thread while
+        # the previous frame is uploaded. The lock is held for the whole
+        # animation, other commands would end up between its frames.
+        async with self.__lock:
+            async with FramePrefetcher(pic_list, self._rasterize_frame, frame_count) as frames:
+                pic_offset = 0
+                pic_speeds = iter(_pic_speeds(pic_speed))
+                async for frame in frames:
+                    await self.__run_deferred(functools.partial(
+                        self._send_frame, frame, frame_count, pic_offset, next(pic_speeds), pic_offset == 0))
+                    pic_offset = pic_offset + 1
+
+    async def set_custom_channel(self, index, gather_command=False):
+        await self.set_custom_page(index, gather_command)
+        await self.set_channel(Channel.CUSTOM, gather_command)
+
+    async def set_face(self, face_id, gather_command=False):
+        await self.set_clock(face_id, gather_command)
+
+    async def set_screen_off(self, gather_command=False):
+        await self.set_screen(False, gather_command)
+
+    async def set_screen_on(self, gather_command=False):
+        await self.set_screen(True, gather_command)
+
+    async def show_image(self, image_path_or_object, xy=(0, 0),
+                         image_resample_mode=ImageResampleMode.PIXEL_ART, pad_resample=False):
+        frame = await asyncio.get_running_loop().run_in_executor(None, functools.partial(
+            self._rasterize_frame, image_path_or_object, image_resample_mode, pad_resample))
+        await self.__show_frame(frame, xy)
+
+    async def show_image_from_url(self, image_url, xy=(0, 0),
+                                  image_resample_mode=ImageResampleMode.PIXEL_ART, pad_resample=False):
+        await self.__show_frame(await self.__url_frame(image_url, image_resample_mode, pad_resample), xy)
+
+    async def show_albumart(self, image):
+        """
+        Display album art of currently played album on pixoo device.
+        """
+        await self.show_image(image, pad_resample=True)
+
+    async def show_albumart_from_url(self, image):
+        await self.show_image_from_url(image, pad_resample=True)
+
+    async def show_album_and_artist(self, image_path, artist, album, track, duration=30):
+        """
+        Displays album art and artist information.
+        Returns once the darkened album art is shown, the information and
+        the plain album art (after duration seconds) follow in the
+        background. A new call replaces whatever is still pending.
+        """
+        self.__cancel_album_timeline()
+        self.__album_generation = generation = self.__album_generation + 1
+
+        loop = asyncio.get_running_loop()
+        try:
+            org_image = image_path if isinstance(image_path, Image.Image) else \
+                await loop.run_in_executor(None, Image.open, image_path)
+        except UnidentifiedImageError:
+            if self.debug:
+                print("No image found")
+            return
+
+        image = await loop.run_in_executor(None, album_art_overlay, org_image)
+        if generation != self.__album_generation:
+            return
+
+        await self.show_albumart(image)
+        if generation != self.__album_generation:
+            return
+
+        self.__album_timeline = asyncio.create_task(
+            self.__run_album_timeline(org_image, artist, album, track, duration))
+        self.__album_timeline.add_done_callback(self.__album_timeline_done)
+
+    async def show_album_and_artist_from_url(self, image_path, artist, album, track, duration=30):
+        try:
+            (width, height), data = await self.__url_frame(image_path, ImageResampleMode.PIXEL_ART, True)
+        except UnidentifiedImageError:
+            if self.debug:
+                print("No image found")
+            return
+
+        image = Image.frombytes('RGB', (width, height), data)
+        await self.show_album_and_artist(image, artist, album, track, duration)
+
+    async def show_animation(self, image_path_or_object, **kwargs):
+        """
+        Plays an animated GIF, APNG or WebP with the timing of its frames.
+        """
+        pic_list, pic_speeds = await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(self._prepare_animation, image_path_or_object, **kwargs))
+        await self.send_animation(pic_list, pic_speeds)
+
+    async def show_animation_from_url(self, image_url, **kwargs):
+        await self.show_animation(io.BytesIO(await self.__fetch(image_url)), **kwargs)
+
+    async def show_artist_info(self, artist, album, track):
+        """
+        Displays information on song, artist, and album.
+        """
+        self.add_display_item(
+            text='{0} - {1}'.format(artist, album), movement_speed=100, xy=(1,32), width=62)
+        self.add_display_item(
+            text='{0}'.format(track), movement_speed=100, xy=(1,48), width=62, identifier=2)
+        await self.send_display_list()
+
+    async def show_frames(self, frames, pic_speed=1000):
+        if len(frames) == 1:
+            (size, data), = frames
+            self.draw_rgb_bytes(data, size)
+            await self.push()
+            return
+
+        if self.counter is None:
+            await self.__load_counter()
+        async with self.__lock:
+            for pic_offset, (frame, speed) in enumerate(zip(frames, _pic_speeds(pic_speed))):
+                await self.__run_deferred(functools.partial(
+                    self._send_frame, frame, len(frames), pic_offset, speed, pic_offset == 0))
+
+    async def turn_on(self):
+        await self.set_screen(True)
+
+    async def turn_off(self):
+        await self.set_screen(False)
+
+    async def update_config(self, force=False):
+        if not force and self._config_is_fresh():
+            return
+
+        self.device_config = await self.__post({
+            'Command': 'Channel/GetAllConf'
+        })
+
+    async def update_score(self):
+        await self.set_scoreboard(self.blue_score, self.red_score)
+
+    def _open_transport(self, pool_size):
+        # The aiohttp session and the AsyncTransport are set up in __init__,
+        # Pixoo's requests session and transport would go unused
+        pass
+
+    async def _run_deferred(self, function):
+        async with self.__lock:
+            await self.__run_deferred(function)
+
+    def __album_timeline_done(self, task):
+        if self.__album_timeline is task:
+            self.__album_timeline = None
+        if not task.cancelled() and task.exception() is not None:
+            _LOGGER.warning("Could not show the artist information: %s", task.exception())
+
+    def __cancel_album_timeline(self):
+        if self.__album_timeline is not None:
+            self.__album_timeline.cancel()
+            self.__album_timeline = None
+
+    def __error(self, error):
+        if self.debug:
+            print('[x] Error on request ' + str(self.counter))
+            print(error)
+
+    async def __fetch(self, url):
+        async with self.__session.get(url, timeout=self.__timeout) as response:
+            return await response.read()
+
+    async def __load_counter(self):
+        self._update_counter(await self.__post({
+            'Command': 'Draw/GetHttpGifId'
+        }))
+
+    async def __post(self, request_dict, body=None):
+        if body is None:
+            body = json.dumps(request_dict)
+        start = time.perf_counter()
+        try:
+            # A simulated client never reaches the network
+            if self.simulated:
+                data = self.simulator.post(body)
+            else:
+                data = await self.__transport.post(request_dict, body)
+        except Exception as ex:
+            self.metrics.record_request(request_dict['Command'], time.perf_counter() - start, len(body),
+                                        type(ex).__name__)
+            raise
+        self.metrics.record_request(request_dict['Command'], time.perf_counter() - start, len(body),
+                                    data['error_code'])
+        return data
+
+    def __prepare_frame(self, image, key):
+        # Runs in the executor
+        image = fit_image(Image.open(image), self.size, key[2], key[3])
+        if self.frame_cache is None:
+            return image.size, image.tobytes()
+        return self.frame_cache.put(key, image.size, image.tobytes())
+
+    async def __run_album_timeline(self, org_image, artist, album, track, duration):
+        await asyncio.sleep(.5)
+        await self.show_artist_info(artist, album, track)
+        await asyncio.sleep(duration)
+        await self.show_albumart(org_image)
+
+    async def __run_deferred(self, function):
+        # Needs to be called with the lock held. Pixoo collects into the
+        # batch of the task running the command, if it has one open
+        batch = _batches.get().get(self)
+        self._batch = list(batch) if batch is not None else None
+        self._deferred_requests = deferred_requests = []
+        try:
+            function()
+        finally:
+            self._deferred_requests = None
+            if batch is not None:
+                batch[:] = self._batch
+            self._batch = None
+
+        await self.__send_requests(deferred_requests)
+
+    async def __send_requests(self, deferred_requests):
+        # Pixoo assumed every deferred request succeeded, so make sure a frame
+        # that didn't reach the device is sent again on the next push
+        delivered = False
+        try:
+            for request_dict, body in deferred_requests:
+                data = await self.__post(request_dict, body)
+                if data['error_code'] == 0:
+                    continue
+
+                if request_dict['Command'] == 'Draw/CommandList':
+                    # The device only tells us the list failed, so send the
+                    # commands that can be repeated one by one to find out
+                    # which of them it rejects. Others may have been carried
+                    # out already
+                    commands = request_dict['CommandList']
+                    await self.__send_requests(
+                        [(command, None) for command in commands if is_idempotent(command)])
+                    if all(is_idempotent(command) for command in commands):
+                        continue
+
+                self.__error(data)
+                if request_dict['Command'] == 'Draw/SendHttpGif':
+                    self.invalidate_frame()
+            delivered = True
+        finally:
+            if not delivered:
+                self.invalidate_frame()
+
+    async def __show_frame(self, frame, xy):
+        # Only the executor scales images, the buffer is drawn on and pushed
+        # in one go so no other push sends it half drawn
+        if self.counter is None:
+            await self.__load_counter()
+        async with self.__lock:
+            self.draw_rgb_bytes(frame[1], frame[0], xy)
+            await self.__run_deferred(functools.partial(Pixoo.push, self))
+
+    async def __url_frame(self, image_url, image_resample_mode, pad_resample):
+        # Downloading and scaling the same album art over and over is a waste
+        loop = asyncio.get_running_loop()
+        key = FrameCache.key(image_url, self.size, image_resample_mode, pad_resample)
+        if self.frame_cache is not None:
+            # Only a cache with a directory needs to touch the disk
+            if self.frame_cache.directory is None:
+                frame = self.frame_cache.get(key)
+            else:
+                frame = await loop.run_in_executor(None, self.frame_cache.get, key)
+            if frame is not None:
+                return frame
+
+        image = io.BytesIO(await self.__fetch(image_url))
+        return await loop.run_in_executor(None, self.__prepare_frame, image, key)
+
+
+async def discover_wifi_devices(session):
+    async with session.post('https://app.divoom-gz.com/Device/ReturnSameLANDevice') as response:
+        data = await response.json(content_type=None)
+    if data['ReturnCode'] != 0:
+        # It's up to the caller to report it, this is what the server said
+        _LOGGER.debug("Device discovery failed: %s", data)
+    return data
+
+
+__all__ = (AsyncPixoo, discover_wifi_devices)
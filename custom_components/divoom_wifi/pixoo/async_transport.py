@@ -0,0 +1,92 @@
+import asyncio
+import random
+import time
+
+import aiohttp
+
+from .transport import (CircuitBreaker, DeviceUnavailableError, PROBE_REQUEST, backoff, command_budget,
+                        is_idempotent, parse_response)
+
+
+class AsyncTransport:
+    """
+    Transport for AsyncPixoo with an aiohttp session. Every attempt has a
+    total timeout, so no request outlives the budget of its command, and
+    the probe while the device is down is a task on the event loop.
+    """
+
+    def __init__(self, url, session, connect_timeout=5, read_timeout=10, retries=2, failure_threshold=3,
+                 probe_interval=5, max_probe_interval=60):
+        self.url = url
+        self.session = session
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.probe_interval = probe_interval
+        self.max_probe_interval = max_probe_interval
+
+        self.breaker = CircuitBreaker(failure_threshold)
+
+        self.__probe_task = None
+
+    @property
+    def available(self):
+        return not self.breaker.is_open
+
+    def close(self):
+        if self.__probe_task is not None:
+            self.__probe_task.cancel()
+            self.__probe_task = None
+
+    async def post(self, request_dict, body):
+        if self.breaker.is_open:
+            raise DeviceUnavailableError('{0} is not responding'.format(self.url))
+
+        deadline = time.monotonic() + command_budget(request_dict)
+        attempts = self.retries + 1 if is_idempotent(request_dict) else 1
+        for attempt in range(attempts):
+            remaining = max(deadline - time.monotonic(), 0.1)
+            try:
+                return await self.__attempt(body, aiohttp.ClientTimeout(
+                    total=remaining, sock_connect=min(self.connect_timeout, remaining)))
+            except (asyncio.TimeoutError, aiohttp.ClientError) as ex:
+                error = ex
+
+            delay = backoff(attempt)
+            if attempt + 1 == attempts or time.monotonic() + delay >= deadline:
+                break
+            await asyncio.sleep(delay)
+
+        if self.breaker.record_failure():
+            self.__start_probing()
+        raise error
+
+    async def __attempt(self, body, timeout):
+        async with self.session.post(self.url, data=body, timeout=timeout) as response:
+            # The device doesn't always send a JSON content type
+            content = await response.read()
+        self.breaker.record_success()
+        return parse_response(content)
+
+    async def __probe(self):
+        interval = self.probe_interval
+        timeout = aiohttp.ClientTimeout(total=self.connect_timeout + self.read_timeout,
+                                        sock_connect=self.connect_timeout)
+        while True:
+            await asyncio.sleep(random.uniform(interval / 2, interval))
+            try:
+                async with self.session.post(self.url, data=PROBE_REQUEST, timeout=timeout) as response:
+                    await response.read()
+            except (asyncio.TimeoutError, aiohttp.ClientError):
+                interval = min(interval * 2, self.max_probe_interval)
+                continue
+            self.breaker.record_success()
+            self.__probe_task = None
+            return
+
+    def __start_probing(self):
+        if self.__probe_task is None:
+            self.__probe_task = asyncio.get_running_loop().create_task(self.__probe())
+
+
+__all__ = (AsyncTransport,)
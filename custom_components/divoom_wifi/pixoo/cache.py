@@ -0,0 +1,213 @@
+import base64
+import hashlib
+import os
+import struct
+import threading
+from collections import OrderedDict
+
+# Width and height in front of the raw RGB data of a cached frame on disk
+_DISK_HEADER = struct.Struct('<HH')
+
+
+class FrameCache:
+    """
+    Least recently used cache of frames that are ready for the device, as
+    (width, height) and raw RGB bytes. Frames are kept in memory up to
+    max_bytes and, when a directory is given, on disk up to max_disk_bytes.
+    """
+
+    def __init__(self, max_bytes=2 * 1024 * 1024, directory=None, max_disk_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+
+        self.__bytes = 0
+        self.__frames = OrderedDict()
+        self.__lock = threading.Lock()
+
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def key(source, size, image_resample_mode, pad_resample):
+        return source, size, int(image_resample_mode), bool(pad_resample)
+
+    @property
+    def stats(self):
+        with self.__lock:
+            return {
+                'entries': len(self.__frames),
+                'bytes': self.__bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'disk_evictions': self.disk_evictions
+            }
+
+    def clear(self):
+        with self.__lock:
+            self.__frames.clear()
+            self.__bytes = 0
+
+    def get(self, key):
+        with self.__lock:
+            frame = self.__frames.get(key)
+            if frame is not None:
+                self.__frames.move_to_end(key)
+                self.hits = self.hits + 1
+                return frame
+
+        frame = self.__read(key)
+        with self.__lock:
+            if frame is None:
+                self.misses = self.misses + 1
+                return None
+
+            self.disk_hits = self.disk_hits + 1
+            self.__store(key, frame)
+        return frame
+
+    def put(self, key, size, data):
+        frame = (tuple(size), bytes(data))
+        with self.__lock:
+            self.__store(key, frame)
+        self.__write(key, frame)
+        return frame
+
+    def __path(self, key):
+        name = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.directory, name + '.rgb')
+
+    def __read(self, key):
+        if self.directory is None:
+            return None
+
+        path = self.__path(key)
+        try:
+            with open(path, 'rb') as file:
+                width, height = _DISK_HEADER.unpack(file.read(_DISK_HEADER.size))
+                data = file.read()
+        except (OSError, struct.error):
+            return None
+
+        if len(data) != width * height * 3:
+            return None
+
+        # Mark it as recently used for the disk eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return (width, height), data
+
+    def __store(self, key, frame):
+        # Needs to be called with the lock held
+        if key in self.__frames:
+            self.__bytes = self.__bytes - len(self.__frames.pop(key)[1])
+
+        if len(frame[1]) > self.max_bytes:
+            return
+
+        self.__frames[key] = frame
+        self.__bytes = self.__bytes + len(frame[1])
+        while self.__bytes > self.max_bytes:
+            _, evicted = self.__frames.popitem(last=False)
+            self.__bytes = self.__bytes - len(evicted[1])
+            self.evictions = self.evictions + 1
+
+    def __write(self, key, frame):
+        if self.directory is None:
+            return
+
+        (width, height), data = frame
+        path = self.__path(key)
+        temporary_path = path + '.tmp'
+        try:
+            with open(temporary_path, 'wb') as file:
+                file.write(_DISK_HEADER.pack(width, height))
+                file.write(data)
+            os.replace(temporary_path, path)
+        except OSError:
+            return
+
+        self.__trim_directory()
+
+    def __trim_directory(self):
+        # Remove the least recently used files until we fit again
+        files = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith('.rgb'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+                total = total + stat.st_size
+
+        files.sort()
+        for _, file_size, path in files:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total = total - file_size
+            self.disk_evictions = self.disk_evictions + 1
+
+
+class PicDataCache:
+    """
+    Least recently used cache of base64 encoded frames, keyed by a digest of
+    the raw frame. Looping animations and repeated frames are only encoded
+    once.
+    """
+
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    @property
+    def stats(self):
+        with self.__lock:
+            return {
+                'entries': len(self.__entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+
+    def encode(self, digest, data):
+        with self.__lock:
+            pic_data = self.__entries.get(digest)
+            if pic_data is not None:
+                self.__entries.move_to_end(digest)
+                self.hits = self.hits + 1
+                return pic_data
+            self.misses = self.misses + 1
+
+        # b64encode reads straight from the buffer, no need to copy it first
+        pic_data = base64.b64encode(data)
+        with self.__lock:
+            self.__entries[digest] = pic_data
+            while len(self.__entries) > self.max_entries:
+                self.__entries.popitem(last=False)
+        return pic_data
+
+
+__all__ = (FrameCache, PicDataCache)
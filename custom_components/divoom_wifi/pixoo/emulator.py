@@ -0,0 +1,206 @@
+import argparse
+import contextlib
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .headless import HeadlessSimulator
+
+# Ways a request can fail: the device answers with an error, closes the
+# connection without answering, never answers, or answers with something
+# that isn't JSON
+FAILURE_MODES = ('error', 'drop', 'hang', 'garbage')
+
+
+class PixooEmulator:
+    """
+    HTTP server that speaks the device's /post protocol, so Pixoo and the
+    integration can be pointed at it instead of a panel. Requests are
+    handled by a HeadlessSimulator (frames, PicID, configuration), with
+    optional latency, bandwidth limit and failures on top.
+    Port 0 picks a free port, start as many emulators as there are devices
+    to simulate.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, size=64, latency=0.0, jitter=0.0, bandwidth=None,
+                 failure_rate=0.0, failure_modes=('error',), fail_commands=(), hang_seconds=30,
+                 max_frames=16, seed=None):
+        self.host = host
+        self.port = port
+
+        # Seconds added to every response, plus up to jitter at random
+        self.latency = latency
+        self.jitter = jitter
+
+        # Bytes per second the requests arrive with, None is unlimited
+        self.bandwidth = bandwidth
+
+        # Share of the requests that fail, and commands that always do
+        self.failure_rate = failure_rate
+        self.failure_modes = tuple(failure_modes)
+        for failure_mode in self.failure_modes:
+            if failure_mode not in FAILURE_MODES:
+                raise ValueError('Unknown failure mode {0}'.format(failure_mode))
+        self.fail_commands = frozenset(fail_commands)
+        self.hang_seconds = hang_seconds
+
+        self.simulator = HeadlessSimulator(size, max_frames)
+        self.failures = 0
+
+        self.__random = random.Random(seed)
+        self.__lock = threading.Lock()
+        self.__server = None
+        self.__thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    @property
+    def address(self):
+        # What Pixoo takes as address
+        return '{0}:{1}'.format(self.host, self.port)
+
+    def start(self):
+        self.__server = ThreadingHTTPServer((self.host, self.port), _handler(self))
+        self.__server.daemon_threads = True
+        self.port = self.__server.server_port
+        self.__thread = threading.Thread(target=self.__server.serve_forever, name='pixoo-emulator', daemon=True)
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+            self.__server = None
+
+    def _delay(self, length):
+        # Seconds it takes to answer a request of length bytes
+        with self.__lock:
+            delay = self.latency + (self.__random.uniform(0, self.jitter) if self.jitter else 0)
+        if self.bandwidth:
+            delay = delay + length / self.bandwidth
+        return delay
+
+    def _failure(self, command):
+        # The way this request fails, or None
+        with self.__lock:
+            if command in self.fail_commands or (
+                    self.failure_rate and self.__random.random() < self.failure_rate):
+                self.failures = self.failures + 1
+                return self.__random.choice(self.failure_modes)
+        return None
+
+
+def _handler(emulator):
+    class PixooRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            if self.path.split('?')[0] != '/post':
+                self.__respond(404, b'')
+                return
+
+            try:
+                command = _command(body)
+            except ValueError:
+                self.__respond(200, b'{"error_code": 1}')
+                return
+
+            time.sleep(emulator._delay(len(body)))
+            failure = emulator._failure(command)
+            if failure == 'drop':
+                self.close_connection = True
+                return
+            if failure == 'hang':
+                time.sleep(emulator.hang_seconds)
+                self.close_connection = True
+                return
+            if failure == 'garbage':
+                self.__respond(200, b'<html>Internal error</html>')
+                return
+            if failure == 'error':
+                self.__respond(200, b'{"error_code": 1}')
+                return
+
+            response = emulator.simulator.post(body)
+            self.__respond(200, json.dumps(response).encode())
+
+        def log_message(self, format, *args):
+            pass
+
+        def __respond(self, status, content):
+            self.send_response(status)
+            # Like the device, which doesn't say it's JSON
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+    return PixooRequestHandler
+
+
+def _command(body):
+    request_dict = json.loads(body)
+    if not isinstance(request_dict, dict):
+        raise ValueError('Not a request')
+    return request_dict.get('Command')
+
+
+def start_fleet(count, port=0, **kwargs):
+    # count emulators on consecutive ports from port, or free ones with 0
+    emulators = []
+    try:
+        for index in range(count):
+            emulators.append(PixooEmulator(port=port + index if port else 0, **kwargs).start())
+    except OSError:
+        for emulator in emulators:
+            emulator.stop()
+        raise
+    return emulators
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Emulate Pixoo devices on this machine.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=0, help='first port, 0 picks free ones')
+    parser.add_argument('--count', type=int, default=1, help='number of devices')
+    parser.add_argument('--size', type=int, default=64, choices=(16, 32, 64))
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds per request')
+    parser.add_argument('--jitter', type=float, default=0.0, help='up to this many seconds more')
+    parser.add_argument('--bandwidth', type=float, default=None, help='bytes per second')
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--failure-modes', default='error', help=','.join(FAILURE_MODES))
+    parser.add_argument('--frames', help='directory to save the received frames to on exit')
+    arguments = parser.parse_args()
+
+    emulators = start_fleet(
+        arguments.count, arguments.port, host=arguments.host, size=arguments.size, latency=arguments.latency,
+        jitter=arguments.jitter, bandwidth=arguments.bandwidth, failure_rate=arguments.failure_rate,
+        failure_modes=arguments.failure_modes.split(','))
+    for emulator in emulators:
+        print('Pixoo emulator listening on {0}'.format(emulator.address))
+
+    with contextlib.suppress(KeyboardInterrupt):
+        while True:
+            time.sleep(1)
+
+    for emulator in emulators:
+        emulator.stop()
+        if arguments.frames:
+            emulator.simulator.save(os.path.join(arguments.frames, str(emulator.port)))
+
+
+__all__ = (FAILURE_MODES, PixooEmulator, start_fleet)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+import base64
+import collections
+import json
+import os
+import threading
+import time
+
+from PIL import Image, PngImagePlugin
+
+# What Channel/GetAllConf answers before anything was changed
+DEFAULT_CONFIG = {
+    'Brightness': 100,
+    'RotationFlag': 0,
+    'ClockTime': 60,
+    'GalleryTime': 60,
+    'SingleGalleyTime': 5,
+    'PowerOnChannelId': 0,
+    'GalleryShowTimeFlag': 0,
+    'CurClockId': 0,
+    'Time24Flag': 1,
+    'TemperatureMode': 0,
+    'GyrateAngle': 0,
+    'MirrorFlag': 0,
+    'LightSwitch': 1
+}
+
+# Setters that change a value of the configuration: the field in the
+# request and the one in the configuration
+_CONFIG_SETTERS = {
+    'Channel/OnOffScreen': ('OnOff', 'LightSwitch'),
+    'Channel/SetBrightness': ('Brightness', 'Brightness'),
+    'Channel/SetClockSelectId': ('ClockId', 'CurClockId'),
+    'Device/SetDisTempMode': ('Mode', 'TemperatureMode'),
+    'Device/SetMirrorMode': ('Mode', 'MirrorFlag'),
+    'Device/SetScreenRotationAngle': ('Mode', 'GyrateAngle'),
+    'Device/SetTime24Flag': ('Mode', 'Time24Flag'),
+}
+
+
+class SimulatedFrame:
+    """
+    A frame as the headless simulator received it: the RGB data decoded
+    from PicData and the request fields that go with it.
+    """
+
+    def __init__(self, size, data, pic_id, pic_num, pic_offset, pic_speed, received, interval):
+        self.size = size
+        self.data = data
+        self.pic_id = pic_id
+        self.pic_num = pic_num
+        self.pic_offset = pic_offset
+        self.pic_speed = pic_speed
+
+        # time.monotonic() when it arrived and the seconds since the frame before
+        self.received = received
+        self.interval = interval
+
+    @property
+    def image(self):
+        return Image.frombytes('RGB', (self.size, self.size), self.data)
+
+    @property
+    def metadata(self):
+        return {
+            'PicID': self.pic_id,
+            'PicNum': self.pic_num,
+            'PicOffset': self.pic_offset,
+            'PicSpeed': self.pic_speed,
+            'received': self.received,
+            'interval': self.interval
+        }
+
+    def save(self, path, scale=1):
+        # PNG with the metadata as text chunks
+        info = PngImagePlugin.PngInfo()
+        for key, value in self.metadata.items():
+            info.add_text(key, str(value))
+        image = self.image
+        if scale != 1:
+            image = image.resize((self.size * scale, self.size * scale), Image.NEAREST)
+        image.save(path, 'PNG', pnginfo=info)
+
+
+class HeadlessSimulator:
+    """
+    Stands in for the device when Pixoo is simulated, without a window. It
+    takes the requests exactly as they would be posted, decodes the frames
+    and keeps the last max_frames of them. PicID works like on the device:
+    Draw/GetHttpGifId returns the last one, Draw/ResetHttpGifId starts over
+    and frames with an older PicID are ignored. The frames of the newest
+    PicID are shown as soon as all PicNum of them arrived.
+    Setters change the configuration that Channel/GetAllConf answers with,
+    or are kept in settings by command.
+    """
+
+    def __init__(self, size=64, max_frames=16):
+        self.size = size
+        self.max_frames = max_frames
+
+        self.bytes_received = 0
+        self.frames_ignored = 0
+        self.frames_received = 0
+        self.pic_id = 0
+        self.requests_received = 0
+
+        self.config = dict(DEFAULT_CONFIG)
+        self.channel = 0
+        self.settings = {}
+
+        self.__animation = []
+        self.__frames = collections.deque(maxlen=max_frames)
+        self.__last_received = None
+        self.__lock = threading.Lock()
+        self.__pending = {}
+
+    @property
+    def animation(self):
+        # The frames on the screen, in order
+        with self.__lock:
+            return list(self.__animation)
+
+    @property
+    def frames(self):
+        with self.__lock:
+            return list(self.__frames)
+
+    @property
+    def images(self):
+        return [frame.image for frame in self.frames]
+
+    def clear(self):
+        with self.__lock:
+            self.__frames.clear()
+
+    def post(self, body):
+        # body is the JSON text (or bytes) of a request, returns the response
+        with self.__lock:
+            self.requests_received = self.requests_received + 1
+            self.bytes_received = self.bytes_received + len(body)
+            return self.__handle(json.loads(body))
+
+    def save(self, directory, scale=1):
+        # Writes the frames as numbered PNG files, returns their paths
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for index, frame in enumerate(self.frames):
+            path = os.path.join(directory, '{0:04}-{1}-{2}.png'.format(index, frame.pic_id, frame.pic_offset))
+            frame.save(path, scale)
+            paths.append(path)
+        return paths
+
+    def __handle(self, request_dict):
+        command = request_dict.get('Command')
+        if command == 'Draw/CommandList':
+            for item in request_dict.get('CommandList', []):
+                response = self.__handle(item)
+                if response['error_code'] != 0:
+                    return response
+            return {'error_code': 0}
+        if command == 'Draw/GetHttpGifId':
+            return {'error_code': 0, 'PicId': self.pic_id}
+        if command == 'Draw/ResetHttpGifId':
+            self.pic_id = 0
+            self.__pending = {}
+            return {'error_code': 0}
+        if command == 'Draw/SendHttpGif':
+            return self.__receive_frame(request_dict)
+
+        if command == 'Channel/GetAllConf':
+            return dict(self.config, error_code=0)
+        if command == 'Channel/GetIndex':
+            return {'error_code': 0, 'SelectIndex': self.channel}
+        if command == 'Channel/GetClockInfo':
+            return {'error_code': 0, 'ClockId': self.config['CurClockId'], 'Brightness': self.config['Brightness']}
+        if command == 'Device/GetDeviceTime':
+            return {'error_code': 0, 'UTCTime': int(time.time()),
+                    'LocalTime': time.strftime('%Y-%m-%d %H:%M:%S')}
+
+        if command in _CONFIG_SETTERS:
+            field, key = _CONFIG_SETTERS[command]
+            if field not in request_dict:
+                return {'error_code': 1}
+            self.config[key] = request_dict[field]
+        elif command == 'Channel/SetIndex':
+            self.channel = request_dict.get('SelectIndex', self.channel)
+        if command is not None and command.split('/')[0] in ('Channel', 'Device', 'Sys', 'Tools'):
+            self.settings[command] = {key: value for key, value in request_dict.items() if key != 'Command'}
+        return {'error_code': 0}
+
+    def __receive_frame(self, request_dict):
+        try:
+            data = base64.b64decode(request_dict['PicData'], validate=True)
+            pic_id = int(request_dict['PicID'])
+        except (KeyError, TypeError, ValueError):
+            return {'error_code': 1}
+        if request_dict.get('PicWidth') != self.size or len(data) != self.size * self.size * 3:
+            return {'error_code': 1}
+
+        # The device keeps showing what it has for an older animation
+        if pic_id < self.pic_id:
+            self.frames_ignored = self.frames_ignored + 1
+            return {'error_code': 0}
+        if pic_id > self.pic_id:
+            self.__pending = {}
+        self.pic_id = pic_id
+
+        received = time.monotonic()
+        interval = received - self.__last_received if self.__last_received is not None else 0.0
+        self.__last_received = received
+
+        frame = SimulatedFrame(
+            self.size, data, pic_id, request_dict.get('PicNum', 1), request_dict.get('PicOffset', 0),
+            request_dict.get('PicSpeed', 1000), received, interval)
+        self.frames_received = self.frames_received + 1
+        self.__frames.append(frame)
+
+        # Once every frame of the animation is there it's shown
+        self.__pending[frame.pic_offset] = frame
+        if len(self.__pending) >= frame.pic_num:
+            self.__animation = [self.__pending[offset] for offset in sorted(self.__pending)]
+            self.__pending = {}
+        return {'error_code': 0}
+
+
+__all__ = (HeadlessSimulator, SimulatedFrame)
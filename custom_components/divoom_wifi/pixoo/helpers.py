@@ -39,11 +39,13 @@ def get_img_like_list(device_id, device_mac, page=1):
             'Page': page
         })
 
-def url_image_handle(url):
+def url_image_handle(url, session=None, timeout=None):
     """
     Returns a handle to directly open pictures from an url.
+    Pass a requests session to reuse its connections, and a timeout
+    (seconds, or connect and read seconds) as requests takes it.
     """
-    return requests.get(url, stream=True).raw
+    return (session or requests).get(url, stream=True, timeout=timeout).raw
 
 def __get_request(url, request_dict={}):
     if request_dict:
@@ -0,0 +1,155 @@
+from PIL import Image, ImageChops
+
+
+class Layer:
+    """
+    Separate framebuffer that Pixoo composites over the screen on push, in
+    the order of z. Where it's drawn is given by mask (an 'L' image or
+    bytes, 0 is see-through) or, without a mask, by every pixel that isn't
+    the transparent color. Set transparent to None for an opaque layer.
+    Changing any of the properties marks the layer dirty, drawing on it
+    through Pixoo.layer() does too.
+    """
+
+    def __init__(self, name, size, z=0, opacity=255, mask=None, transparent=(0, 0, 0)):
+        self.name = name
+        self.size = size
+        self.buffer = bytearray(size * size * 3)
+        self.dirty = True
+
+        self.__z = z
+        self.__opacity = opacity
+        self.__mask = None
+        self.__transparent = transparent
+        self.mask = mask
+
+        # Loading the buffer into an existing image is cheaper than a new one
+        self.__image = Image.new('RGB', (size, size))
+
+    @property
+    def mask(self):
+        return self.__mask
+
+    @mask.setter
+    def mask(self, mask):
+        if mask is not None and not isinstance(mask, Image.Image):
+            mask = Image.frombytes('L', (self.size, self.size), bytes(mask))
+        elif mask is not None:
+            mask = mask.convert('L')
+        self.__mask = mask
+        self.dirty = True
+
+    @property
+    def opacity(self):
+        return self.__opacity
+
+    @opacity.setter
+    def opacity(self, opacity):
+        self.__opacity = max(0, min(255, int(opacity)))
+        self.dirty = True
+
+    @property
+    def transparent(self):
+        return self.__transparent
+
+    @transparent.setter
+    def transparent(self, transparent):
+        self.__transparent = transparent
+        self.dirty = True
+
+    @property
+    def z(self):
+        return self.__z
+
+    @z.setter
+    def z(self, z):
+        self.__z = z
+        self.dirty = True
+
+    def render(self):
+        # The part of the layer that shows as an RGB image, the alpha to
+        # paste it with and the box it covers, or None when nothing shows.
+        # Everything after finding the box is limited to it, a clock or a
+        # badge only covers a small part of the screen.
+        image = self.__image
+        image.frombytes(bytes(self.buffer))
+        if self.__mask is not None:
+            box = self.__mask.getbbox()
+        elif self.__transparent is None:
+            box = (0, 0, self.size, self.size)
+        elif any(self.__transparent):
+            box = ImageChops.difference(image, Image.new('RGB', image.size, tuple(self.__transparent))).getbbox()
+        else:
+            box = image.getbbox()
+        if box is None or self.__opacity == 0:
+            return None
+
+        image = image.crop(box)
+        if self.__mask is not None:
+            alpha = self.__mask.crop(box)
+        elif self.__transparent is not None:
+            # Anything that differs from the transparent color in any channel.
+            # Adding with a scale of 1/128 turns every difference into 255.
+            difference = image
+            if any(self.__transparent):
+                difference = ImageChops.difference(image, Image.new('RGB', image.size, tuple(self.__transparent)))
+            red, green, blue = difference.split()
+            alpha = ImageChops.lighter(ImageChops.lighter(red, green), blue)
+            alpha = ImageChops.add(alpha, alpha, scale=1 / 128)
+        else:
+            alpha = Image.new('L', image.size, 255)
+
+        if self.__opacity < 255:
+            alpha = ImageChops.multiply(alpha, Image.new('L', image.size, self.__opacity))
+        return image, alpha, box
+
+
+class Compositor:
+    """
+    Blends layers over a base frame with PIL. The result after every layer
+    is kept, so only the layers from the lowest dirty one up are blended
+    again, or all of them when the base frame changed. Each of them only
+    over the box it covers.
+    """
+
+    def __init__(self, size):
+        self.size = size
+
+        self.__base = None
+        self.__base_image = Image.new('RGB', (size, size))
+        self.__layers = []
+        self.__images = []
+
+    def compose(self, base, layers):
+        # layers in the order they're blended, returns the RGB bytes
+        start = 0 if base != self.__base else len(self.__layers)
+        for index, layer in enumerate(layers):
+            if index >= len(self.__layers) or self.__layers[index] is not layer or layer.dirty:
+                start = min(start, index)
+                break
+        start = min(start, len(layers))
+
+        if start == 0:
+            if base != self.__base:
+                self.__base = bytes(base)
+                self.__base_image.frombytes(self.__base)
+            image = self.__base_image
+        else:
+            image = self.__images[start - 1]
+
+        images = self.__images[:start]
+        for layer in layers[start:]:
+            rendered = layer.render()
+            if rendered is not None:
+                layer_image, alpha, box = rendered
+                image = image.copy()
+                image.paste(layer_image, box[:2], alpha)
+            images.append(image)
+            layer.dirty = False
+
+        self.__layers = list(layers)
+        self.__images = images
+        return image.tobytes()
+
+
+__all__ = (Compositor, Layer)
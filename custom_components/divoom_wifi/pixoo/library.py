@@ -0,0 +1,273 @@
+import concurrent.futures
+import hashlib
+import json
+import os
+import threading
+
+from PIL import Image, UnidentifiedImageError
+
+from . import decode_animation
+
+# Files we try to convert, everything else in the directory is ignored
+MEDIA_EXTENSIONS = frozenset(('.bmp', '.gif', '.jpeg', '.jpg', '.png', '.webp'))
+
+# Bump when the converted data or the index changes its layout
+_INDEX_VERSION = 1
+_INDEX_FILE = 'index.json'
+
+
+def convert_media(path, size, directory, digest=None):
+    # Runs in a worker process. Converts the image or animation at path to
+    # raw RGB frames at display size and writes them to directory, unless
+    # its content still matches digest. Returns the entry for the index.
+    entry = {'digest': _file_digest(path)}
+    if entry['digest'] == digest and os.path.exists(
+            os.path.join(directory, '{0}-{1}.rgb'.format(digest, size))):
+        return entry
+
+    try:
+        with Image.open(path) as image:
+            frames = decode_animation(image, size)
+    except (OSError, UnidentifiedImageError, ValueError, EOFError, SyntaxError, Image.DecompressionBombError) as ex:
+        entry['error'] = str(ex)
+        return entry
+
+    # All frames of an image have the same size
+    entry['file'] = '{0}-{1}.rgb'.format(entry['digest'], size)
+    entry['width'], entry['height'] = frames[0][0].size
+    entry['speeds'] = [speed for _, speed in frames]
+
+    data_path = os.path.join(directory, entry['file'])
+    temporary_path = '{0}.{1}.{2}.tmp'.format(data_path, os.getpid(), threading.get_ident())
+    with open(temporary_path, 'wb') as file:
+        for frame, _ in frames:
+            file.write(frame.tobytes())
+    os.replace(temporary_path, data_path)
+    return entry
+
+
+def _file_digest(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MediaLibrary:
+    """
+    Index of the images and animations in a directory, converted once to
+    frames for a display of the given size. update() only converts files
+    that are new or have changed since the last time, in worker processes.
+    Creating a library and everything else here does blocking I/O.
+    """
+
+    def __init__(self, media_directory, size, directory, max_workers=None, mp_context=None):
+        self.media_directory = media_directory
+        self.size = size
+        self.directory = directory
+        self.max_workers = max_workers
+        self.mp_context = mp_context
+
+        self.__items = {}
+        self.__lock = threading.Lock()
+        self.__update_lock = threading.Lock()
+
+        os.makedirs(self.directory, exist_ok=True)
+        self.__read_index()
+
+    @property
+    def names(self):
+        return sorted(name for name, entry in self.__items.items() if 'error' not in entry)
+
+    def find(self, name):
+        # The name is the path relative to the media directory, the
+        # extension can be left out as long as that isn't ambiguous
+        if name in self.__items:
+            return name
+
+        matches = [item for item in self.__items if os.path.splitext(item)[0] == name]
+        return matches[0] if len(matches) == 1 else None
+
+    def is_current(self, name):
+        entry = self.__items.get(name)
+        if entry is None:
+            return False
+
+        try:
+            stat = os.stat(os.path.join(self.media_directory, name))
+        except OSError:
+            return False
+        return (stat.st_mtime_ns, stat.st_size) == (entry['mtime'], entry['bytes'])
+
+    def load(self, name, refresh=True):
+        # Returns the frames as a list of ((width, height), RGB bytes) and
+        # the PicSpeed of each of them, without any image processing. An
+        # item that is new or changed is converted right here, without
+        # waiting for update() to get to it.
+        found = self.find(name)
+        if refresh and (found is None or not self.is_current(found)):
+            found = self.__convert(found if found is not None else self.__locate(name))
+
+        entry = self.__items.get(found)
+        if entry is None:
+            raise KeyError(name)
+        if 'error' in entry:
+            raise ValueError('{0} could not be converted: {1}'.format(found, entry['error']))
+
+        size = (entry['width'], entry['height'])
+        frame_length = size[0] * size[1] * 3
+        with open(os.path.join(self.directory, entry['file']), 'rb') as file:
+            data = memoryview(file.read())
+        frames = [(size, data[offset:offset + frame_length])
+                  for offset in range(0, len(data), frame_length)]
+        return frames, entry['speeds']
+
+    def update(self):
+        # Bring the index in line with the media directory, returns the
+        # names of the items that were (re)converted. The index is only
+        # locked to look at it and to take in the results, load() can
+        # convert items while the workers are busy.
+        with self.__update_lock:
+            files = self.__scan()
+            with self.__lock:
+                previous = dict(self.__items)
+
+            changed = {}
+            for name, stat in files.items():
+                entry = previous.get(name)
+                if entry is None or (entry['mtime'], entry['bytes']) != stat:
+                    changed[name] = entry
+
+            results = {}
+            if changed:
+                with concurrent.futures.ProcessPoolExecutor(
+                        max_workers=self.max_workers, mp_context=self.mp_context) as executor:
+                    futures = {
+                        executor.submit(
+                            convert_media, os.path.join(self.media_directory, name), self.size,
+                            self.directory, entry.get('digest') if entry and 'file' in entry else None): name
+                        for name, entry in changed.items()
+                    }
+                    for future in concurrent.futures.as_completed(futures):
+                        name = futures[future]
+                        try:
+                            results[name] = future.result()
+                        except (OSError, concurrent.futures.BrokenExecutor):
+                            # Gone or unreadable, or the worker died, it will
+                            # be picked up again by the next update
+                            results[name] = None
+                        except Exception as ex:
+                            # Whatever else decoding the file raised, it is
+                            # skipped until it changes
+                            results[name] = {'error': '{0}: {1}'.format(type(ex).__name__, ex)}
+
+            with self.__lock:
+                items = {name: entry for name, entry in self.__items.items()
+                         if name in files or name not in previous}
+
+                converted = []
+                for name, entry in results.items():
+                    if items.get(name) is not previous.get(name):
+                        # load() converted it in the meantime
+                        continue
+                    if entry is None:
+                        items.pop(name, None)
+                        continue
+
+                    if 'file' not in entry and 'error' not in entry:
+                        # Only touched, the converted frames are still good
+                        entry = dict(previous[name], digest=entry['digest'])
+                    else:
+                        converted.append(name)
+
+                    entry['mtime'], entry['bytes'] = files[name]
+                    items[name] = entry
+
+                self.__items = items
+                self.__write_index()
+                self.__remove_unused_files()
+            return sorted(converted)
+
+    def __convert(self, name):
+        # Converts a single item in this thread, returns its name or None
+        # when there is no such file
+        if name is None:
+            return None
+        path = os.path.join(self.media_directory, name)
+        with self.__lock:
+            previous = self.__items.get(name)
+            try:
+                stat = os.stat(path)
+                entry = convert_media(path, self.size, self.directory,
+                                      previous.get('digest') if previous and 'file' in previous else None)
+            except OSError:
+                return None
+
+            if 'file' not in entry and 'error' not in entry:
+                entry = dict(previous, digest=entry['digest'])
+            entry['mtime'], entry['bytes'] = stat.st_mtime_ns, stat.st_size
+
+            items = dict(self.__items)
+            items[name] = entry
+            self.__items = items
+            self.__write_index()
+        return name
+
+    def __locate(self, name):
+        # The name of a media file that isn't in the index yet, as long as
+        # it's inside the media directory
+        if os.path.isabs(name) or os.path.normpath(name).split(os.sep)[0] == '..':
+            return None
+        candidates = [name] + [name + extension for extension in sorted(MEDIA_EXTENSIONS)]
+        for candidate in candidates:
+            if os.path.splitext(candidate)[1].lower() in MEDIA_EXTENSIONS and os.path.isfile(
+                    os.path.join(self.media_directory, candidate)):
+                return candidate
+        return None
+
+    def __read_index(self):
+        try:
+            with open(os.path.join(self.directory, _INDEX_FILE)) as file:
+                index = json.load(file)
+        except (OSError, ValueError):
+            return
+
+        if index.get('version') == _INDEX_VERSION and index.get('size') == self.size:
+            self.__items = index['items']
+
+    def __remove_unused_files(self):
+        used = set(entry['file'] for entry in self.__items.values() if 'file' in entry)
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.rgb') and entry.name not in used:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+
+    def __scan(self):
+        # Names (relative paths) of the media files with their mtime and size
+        files = {}
+        for root, directories, filenames in os.walk(self.media_directory):
+            directories[:] = [directory for directory in directories if not directory.startswith('.')]
+            for filename in filenames:
+                if os.path.splitext(filename)[1].lower() not in MEDIA_EXTENSIONS:
+                    continue
+
+                path = os.path.join(root, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                name = os.path.relpath(path, self.media_directory).replace(os.sep, '/')
+                files[name] = (stat.st_mtime_ns, stat.st_size)
+        return files
+
+    def __write_index(self):
+        path = os.path.join(self.directory, _INDEX_FILE)
+        with open(path + '.tmp', 'w') as file:
+            json.dump({'version': _INDEX_VERSION, 'size': self.size, 'items': self.__items}, file)
+        os.replace(path + '.tmp', path)
+
+
+__all__ = (MediaLibrary, convert_media)
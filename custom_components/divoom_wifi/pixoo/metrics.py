@@ -0,0 +1,101 @@
+import collections
+import math
+import threading
+
+
+def percentile(samples, fraction):
+    # Nearest rank on sorted samples
+    if not samples:
+        return None
+    return samples[max(0, math.ceil(fraction * len(samples)) - 1)]
+
+
+def _milliseconds(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+class _Timing:
+    # Count, total and the most recent samples of a duration in seconds
+
+    def __init__(self, max_samples):
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.samples = collections.deque(maxlen=max_samples)
+
+    def add(self, seconds):
+        self.count = self.count + 1
+        self.total = self.total + seconds
+        self.maximum = max(self.maximum, seconds)
+        self.samples.append(seconds)
+
+    def summary(self):
+        # In milliseconds, percentiles over the recent samples
+        samples = sorted(self.samples)
+        return {
+            'count': self.count,
+            'mean_ms': _milliseconds(self.total / self.count if self.count else None),
+            'p50_ms': _milliseconds(percentile(samples, 0.50)),
+            'p95_ms': _milliseconds(percentile(samples, 0.95)),
+            'p99_ms': _milliseconds(percentile(samples, 0.99)),
+            'max_ms': _milliseconds(self.maximum if self.count else None)
+        }
+
+
+class Metrics:
+    """
+    Per command counts, errors, bytes and latency of the requests a client
+    sent, and the time spent on named steps like rendering and encoding
+    frames. Percentiles are over the last max_samples of each.
+    """
+
+    def __init__(self, max_samples=1024):
+        self.max_samples = max_samples
+
+        self.__commands = {}
+        self.__lock = threading.Lock()
+        self.__timings = {}
+
+    def record_request(self, command, seconds, bytes_sent, error_code=0):
+        # error_code is the device's, or the name of the exception raised
+        with self.__lock:
+            metrics = self.__commands.get(command)
+            if metrics is None:
+                metrics = self.__commands[command] = {
+                    'latency': _Timing(self.max_samples),
+                    'bytes_sent': 0,
+                    'errors': collections.Counter()
+                }
+            metrics['latency'].add(seconds)
+            metrics['bytes_sent'] = metrics['bytes_sent'] + bytes_sent
+            if error_code != 0:
+                metrics['errors'][str(error_code)] += 1
+
+    def record_timing(self, name, seconds):
+        with self.__lock:
+            timing = self.__timings.get(name)
+            if timing is None:
+                timing = self.__timings[name] = _Timing(self.max_samples)
+            timing.add(seconds)
+
+    def reset(self):
+        with self.__lock:
+            self.__commands = {}
+            self.__timings = {}
+
+    def snapshot(self):
+        with self.__lock:
+            commands = {}
+            for command, metrics in sorted(self.__commands.items()):
+                commands[command] = dict(
+                    metrics['latency'].summary(),
+                    bytes_sent=metrics['bytes_sent'],
+                    errors=dict(metrics['errors']),
+                    error_count=sum(metrics['errors'].values()))
+            return {
+                'commands': commands,
+                'timings': {name: timing.summary() for name, timing in sorted(self.__timings.items())}
+            }
+
+
+__all__ = (Metrics, percentile)
@@ -0,0 +1,147 @@
+# Integer rasterization of shapes into horizontal spans: lists of
+# (y, first x, last x) that Pixoo.draw_spans and draw_shapes fill with
+# slice writes. Nothing here knows about the screen size, clipping is done
+# when the spans are drawn.
+
+
+def circle_spans(center, radius, filled=False):
+    # Midpoint circle, symmetric in all eight octants
+    cx, cy = center
+    if radius < 0:
+        return []
+    if radius == 0:
+        return [(cy, cx, cx)]
+
+    # Widest extent of the circle on every row
+    extents = {}
+
+    def widen(y, half_width):
+        if extents.get(y, -1) < half_width:
+            extents[y] = half_width
+
+    x, y = radius, 0
+    error = 1 - radius
+    while x >= y:
+        widen(cy + y, x)
+        widen(cy - y, x)
+        widen(cy + x, y)
+        widen(cy - x, y)
+        y = y + 1
+        if error < 0:
+            error = error + 2 * y + 1
+        else:
+            x = x - 1
+            error = error + 2 * (y - x) + 1
+
+    if filled:
+        return [(row, cx - half_width, cx + half_width) for row, half_width in sorted(extents.items())]
+
+    # The outline is the part of every row that the rows next to it don't
+    # cover, so it stays closed where the circle is steep
+    spans = []
+    for row, half_width in sorted(extents.items()):
+        inner = min(extents.get(row - 1, -1), extents.get(row + 1, -1))
+        inner = min(inner + 1, half_width)
+        if inner <= 0:
+            spans.append((row, cx - half_width, cx + half_width))
+            continue
+        spans.append((row, cx - half_width, cx - inner))
+        spans.append((row, cx + inner, cx + half_width))
+    return spans
+
+
+def line_spans(start_xy, stop_xy):
+    # Bresenham, including both end points. Pixels next to each other on a
+    # row are merged into one span, so flat lines are a single write.
+    x0, y0 = int(start_xy[0]), int(start_xy[1])
+    x1, y1 = int(stop_xy[0]), int(stop_xy[1])
+    dx = abs(x1 - x0)
+    dy = -abs(y1 - y0)
+    step_x = 1 if x0 < x1 else -1
+    step_y = 1 if y0 < y1 else -1
+    error = dx + dy
+
+    spans = []
+    run_start = x0
+    while True:
+        if x0 == x1 and y0 == y1:
+            spans.append((y0, min(run_start, x0), max(run_start, x0)))
+            return spans
+
+        double_error = 2 * error
+        if double_error <= dx:
+            # Moving to the next row ends the current run
+            if double_error >= dy:
+                error = error + dy
+                next_x = x0 + step_x
+            else:
+                next_x = x0
+            spans.append((y0, min(run_start, x0), max(run_start, x0)))
+            error = error + dx
+            y0 = y0 + step_y
+            x0 = next_x
+            run_start = x0
+        else:
+            error = error + dy
+            x0 = x0 + step_x
+
+
+def polygon_spans(points):
+    # Filled polygon (even-odd rule), sampled at the center of every row,
+    # together with its outline so thin parts don't disappear
+    points = [(int(x), int(y)) for x, y in points]
+    spans = polyline_spans(points, closed=True)
+    if len(points) < 3:
+        return spans
+
+    edges = []
+    for index, (x0, y0) in enumerate(points):
+        x1, y1 = points[(index + 1) % len(points)]
+        if y0 != y1:
+            edges.append((x0, y0, x1, y1) if y0 < y1 else (x1, y1, x0, y0))
+
+    for y in range(min(y for _, y in points), max(y for _, y in points) + 1):
+        # Crossings of the row's center line, as the nearest pixel in integers:
+        # x = x0 + (y + 0.5 - y0) * (x1 - x0) / (y1 - y0)
+        crossings = sorted(
+            x0 + ((2 * (y - y0) + 1) * (x1 - x0) + (y1 - y0)) // (2 * (y1 - y0))
+            for x0, y0, x1, y1 in edges if y0 <= y < y1)
+        for left, right in zip(crossings[::2], crossings[1::2]):
+            if left <= right:
+                spans.append((y, left, right))
+    return spans
+
+
+def polyline_spans(points, closed=False):
+    points = list(points)
+    if len(points) == 1:
+        return line_spans(points[0], points[0])
+
+    segments = list(zip(points, points[1:]))
+    if closed and len(points) > 2:
+        segments.append((points[-1], points[0]))
+
+    spans = []
+    for start_xy, stop_xy in segments:
+        spans.extend(line_spans(start_xy, stop_xy))
+    return spans
+
+
+def rectangle_spans(top_left_xy, bottom_right_xy, filled=True):
+    left, top = top_left_xy
+    right, bottom = bottom_right_xy
+    if left > right or top > bottom:
+        return []
+    if filled or bottom - top < 2:
+        return [(y, left, right) for y in range(top, bottom + 1)]
+
+    spans = [(top, left, right)]
+    for y in range(top + 1, bottom):
+        spans.append((y, left, left))
+        if right != left:
+            spans.append((y, right, right))
+    spans.append((bottom, left, right))
+    return spans
+
+
+__all__ = (circle_spans, line_spans, polygon_spans, polyline_spans, rectangle_spans)
@@ -0,0 +1,149 @@
+import json
+import mmap
+import os
+import struct
+import threading
+
+from PIL import Image
+
+from . import fit_image
+
+# Magic, version, display size, offset and length of the name index
+_HEADER = struct.Struct('<4sHHQQ')
+_HEADER_SIZE = 32
+_MAGIC = b'PXFS'
+_VERSION = 1
+
+
+class FrameStore:
+    """
+    File of raw RGB frames for a display of the given size, each exactly
+    size * size * 3 bytes, with a name index at the end. The file is memory
+    mapped, so reading a frame gives a memoryview into it without copying
+    and opening a store doesn't read the frames at all.
+    Items are only ever appended, the header is updated last so a store
+    that was interrupted while adding still has its previous index.
+    """
+
+    def __init__(self, path, size=64):
+        self.path = path
+        self.size = size
+        self.frame_length = size * size * 3
+
+        self.__index = {}
+        self.__lock = threading.Lock()
+        self.__map = None
+
+        if not os.path.exists(path):
+            self.__write_index(path, self.__index, _HEADER_SIZE)
+        self.__open()
+
+    def __contains__(self, name):
+        return name in self.__index
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def names(self):
+        return sorted(self.__index)
+
+    def add(self, name, frames, pic_speeds=1000):
+        # Frames can be images, paths or ((width, height), RGB bytes), the
+        # ones smaller than the display end up in the top left corner on
+        # black. Replaces whatever was stored under name before.
+        frames = [self.__rasterize(frame) for frame in frames]
+        if isinstance(pic_speeds, int):
+            pic_speeds = [pic_speeds] * len(frames)
+
+        with self.__lock:
+            with open(self.path, 'ab') as file:
+                offset = file.tell()
+                for frame in frames:
+                    file.write(frame)
+
+            self.__index[name] = [offset, len(frames), list(pic_speeds)]
+            self.__write_index(self.path, self.__index, offset + len(frames) * self.frame_length)
+            self.__open()
+
+    def close(self):
+        # Frames that are still referenced keep the old mapping alive
+        self.__map = None
+
+    def compact(self):
+        # Drop replaced items and old indexes by writing a new file, which
+        # replaces the store once it's complete
+        with self.__lock:
+            temporary_path = self.path + '.tmp'
+            index = {}
+            with open(temporary_path, 'wb') as file:
+                file.write(bytes(_HEADER_SIZE))
+                for name, (offset, count, pic_speeds) in self.__index.items():
+                    index[name] = [file.tell(), count, pic_speeds]
+                    file.write(self.__map[offset:offset + count * self.frame_length])
+                index_offset = file.tell()
+            self.__write_index(temporary_path, index, index_offset)
+
+            os.replace(temporary_path, self.path)
+            self.__open()
+
+    def frame(self, name, index=0):
+        offset, count, _ = self.__index[name]
+        if not 0 <= index < count:
+            raise IndexError(index)
+
+        start = offset + index * self.frame_length
+        return memoryview(self.__map)[start:start + self.frame_length]
+
+    def frames(self, name):
+        # The frames of an item as Pixoo.show_frames and send_animation take
+        # them, and their PicSpeed
+        _, count, pic_speeds = self.__index[name]
+        size = (self.size, self.size)
+        return [(size, self.frame(name, index)) for index in range(count)], pic_speeds
+
+    def __open(self):
+        with open(self.path, 'rb') as file:
+            magic, version, size, index_offset, index_length = _HEADER.unpack(file.read(_HEADER.size))
+            if magic != _MAGIC or version != _VERSION:
+                raise ValueError('{0} is not a frame store'.format(self.path))
+            if size != self.size:
+                raise ValueError('{0} holds frames for a {1}x{1} display'.format(self.path, size))
+
+            file.seek(index_offset)
+            self.__index = json.loads(file.read(index_length))
+            self.__map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __rasterize(self, frame):
+        if isinstance(frame, tuple):
+            size, data = frame
+            image = Image.frombytes('RGB', size, bytes(data))
+        else:
+            image = frame if isinstance(frame, Image.Image) else Image.open(frame)
+        image = fit_image(image, self.size)
+
+        if image.size != (self.size, self.size):
+            canvas = Image.new('RGB', (self.size, self.size))
+            canvas.paste(image, (0, 0))
+            image = canvas
+        return image.tobytes()
+
+    def __write_index(self, path, index, index_offset):
+        # The index goes after the last frame, the header points to it once
+        # the index is on disk
+        index = json.dumps(index).encode()
+        with open(path, 'r+b' if os.path.exists(path) else 'wb') as file:
+            file.seek(index_offset)
+            file.write(index)
+            file.flush()
+            os.fsync(file.fileno())
+            file.seek(0)
+            file.write(_HEADER.pack(_MAGIC, _VERSION, self.size, index_offset, len(index)))
+            file.flush()
+            os.fsync(file.fileno())
+
+
+__all__ = (FrameStore,)
@@ -0,0 +1,136 @@
+import math
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import BdfFontFile, Image, ImageDraw, ImageFont, PcfFontFile
+
+
+def load_font(path, size=8):
+    # TrueType/OpenType fonts are scaled to size, bitmap fonts (BDF, PCF
+    # and PIL's own .pil) come in the one size they were drawn in
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.bdf', '.pcf'):
+        with open(path, 'rb') as file:
+            font_file = BdfFontFile.BdfFontFile(file) if extension == '.bdf' else PcfFontFile.PcfFontFile(file)
+            return font_file.to_imagefont()
+    if extension == '.pil':
+        return ImageFont.load(path)
+    return ImageFont.truetype(path, size)
+
+
+class TextRenderer:
+    """
+    Lays out text in a PIL font and renders it into masks that
+    Pixoo.draw_mask (and draw_text with font=) blits into the framebuffer.
+    Glyphs are rasterized once, without anti-aliasing so they stay crisp on
+    the panel, and whole layouts are cached by text and width.
+    """
+
+    def __init__(self, font, size=8, line_spacing=1, max_layouts=128):
+        # font is a path (see load_font) or a loaded PIL font
+        self.font = load_font(font, size) if isinstance(font, str) else font
+        self.line_spacing = line_spacing
+        self.max_layouts = max_layouts
+
+        if hasattr(self.font, 'getmetrics'):
+            ascent, descent = self.font.getmetrics()
+            self.line_height = ascent + descent
+        else:
+            self.line_height = self.font.getbbox('Ay')[3]
+
+        self.__glyphs = {}
+        self.__layouts = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def measure(self, text):
+        return sum(self.__glyph(character)[0] for character in text)
+
+    def render(self, text, max_width=None):
+        # Returns (width, rows) with one integer per row of pixels, like
+        # text_mask. Lines are wrapped at spaces to fit max_width, words
+        # that don't fit on a line of their own are broken up.
+        key = (text, max_width)
+        with self.__lock:
+            mask = self.__layouts.get(key)
+            if mask is not None:
+                self.__layouts.move_to_end(key)
+                return mask
+
+        mask = self.__render_lines(self.wrap(text, max_width))
+        with self.__lock:
+            self.__layouts[key] = mask
+            while len(self.__layouts) > self.max_layouts:
+                self.__layouts.popitem(last=False)
+        return mask
+
+    def wrap(self, text, max_width=None):
+        lines = []
+        for paragraph in text.split('\n'):
+            if max_width is None:
+                lines.append(paragraph)
+                continue
+
+            line = ''
+            for word in paragraph.split(' '):
+                candidate = word if not line else line + ' ' + word
+                if self.measure(candidate) <= max_width:
+                    line = candidate
+                    continue
+
+                if line:
+                    lines.append(line)
+                # Break up words that are wider than a line by themselves
+                line = ''
+                for character in word:
+                    if line and self.measure(line + character) > max_width:
+                        lines.append(line)
+                        line = ''
+                    line = line + character
+            lines.append(line)
+        return lines
+
+    def __glyph(self, character):
+        # (advance, rows) of a single character
+        glyph = self.__glyphs.get(character)
+        if glyph is not None:
+            return glyph
+
+        advance = math.ceil(self.font.getlength(character))
+        rows = (0,) * self.line_height
+        if advance > 0:
+            image = Image.new('L', (advance, self.line_height))
+            draw = ImageDraw.Draw(image)
+            draw.fontmode = '1'
+            draw.text((0, 0), character, font=self.font, fill=255)
+
+            # Lit pixels become 0xFFFFFF, one integer per row
+            data = Image.merge('RGB', (image, image, image)).point(lambda value: 255 if value else 0).tobytes()
+            length = advance * 3
+            rows = tuple(int.from_bytes(data[y * length:(y + 1) * length], 'big')
+                         for y in range(self.line_height))
+
+        glyph = self.__glyphs[character] = (advance, rows)
+        return glyph
+
+    def __render_lines(self, lines):
+        width = max((self.measure(line) for line in lines), default=0)
+        rows = []
+        for index, line in enumerate(lines):
+            if index:
+                rows.extend((0,) * self.line_spacing)
+
+            line_width = 0
+            line_rows = [0] * self.line_height
+            for character in line:
+                advance, glyph_rows = self.__glyph(character)
+                for y in range(self.line_height):
+                    line_rows[y] = (line_rows[y] << advance * 24) | glyph_rows[y]
+                line_width = line_width + advance
+
+            # Rows are aligned to the left of the widest line
+            rows.extend(row << (width - line_width) * 24 for row in line_rows)
+        return width, tuple(rows)
+
+
+__all__ = (TextRenderer, load_font)
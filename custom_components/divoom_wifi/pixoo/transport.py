@@ -0,0 +1,197 @@
+import json
+import random
+import threading
+import time
+
+import requests
+
+# Seconds a command may take in total, retries and their backoff included
+DEFAULT_BUDGET = 10
+COMMAND_BUDGETS = {
+    'Channel/GetAllConf': 5,
+    'Channel/GetClockInfo': 5,
+    'Channel/GetIndex': 5,
+    'Device/GetDeviceTime': 5,
+    'Device/GetWeatherInfo': 5,
+    'Draw/GetHttpGifId': 5,
+    'Draw/ResetHttpGifId': 5,
+}
+
+# Commands that leave the device in the same state when they arrive twice,
+# only these are retried. Frames, text, the buzzer and timers are not.
+IDEMPOTENT_COMMANDS = frozenset((
+    'Channel/CloudIndex',
+    'Channel/GetAllConf',
+    'Channel/GetClockInfo',
+    'Channel/GetIndex',
+    'Channel/OnOffScreen',
+    'Channel/SetBrightness',
+    'Channel/SetClockSelectId',
+    'Channel/SetCustomPageIndex',
+    'Channel/SetEqPosition',
+    'Channel/SetIndex',
+    'Device/GetDeviceTime',
+    'Device/GetWeatherInfo',
+    'Device/SetDisTempMode',
+    'Device/SetHighLightMode',
+    'Device/SetMirrorMode',
+    'Device/SetScreenRotationAngle',
+    'Device/SetTime24Flag',
+    'Device/SetUTC',
+    'Device/SetWhiteBalance',
+    'Draw/GetHttpGifId',
+    'Draw/ResetHttpGifId',
+    'Sys/LogAndLat',
+    'Sys/TimeZone',
+    'Tools/SetNoiseStatus',
+    'Tools/SetScoreBoard',
+))
+
+# error_code of a response that isn't what the device sends
+INVALID_RESPONSE = -1
+
+# Sent while the device is down to find out when it's back
+PROBE_REQUEST = json.dumps({'Command': 'Draw/GetHttpGifId'})
+
+
+class DeviceUnavailableError(Exception):
+    """
+    The device failed too many requests in a row. Requests fail right away
+    until a probe in the background gets an answer from it again.
+    """
+
+
+def backoff(attempt, base=0.25, maximum=2.0):
+    # Full jitter, so clients that failed together don't retry together
+    return random.uniform(0, min(maximum, base * 2 ** attempt))
+
+
+def command_budget(request_dict):
+    return COMMAND_BUDGETS.get(request_dict['Command'], DEFAULT_BUDGET)
+
+
+def is_idempotent(request_dict):
+    if request_dict['Command'] == 'Draw/CommandList':
+        return all(is_idempotent(command) for command in request_dict['CommandList'])
+
+    return request_dict['Command'] in IDEMPOTENT_COMMANDS
+
+
+def parse_response(content):
+    # Anything that isn't a JSON object with an error_code is turned into
+    # an error the callers already handle
+    try:
+        data = json.loads(content)
+    except ValueError:
+        data = None
+    if not isinstance(data, dict) or 'error_code' not in data:
+        return {'error_code': INVALID_RESPONSE, 'response': content[:100]}
+    return data
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold failed requests in a row and stays open
+    until a request succeeds again.
+    """
+
+    def __init__(self, failure_threshold=3):
+        self.failure_threshold = failure_threshold
+
+        self.failures = 0
+        self.is_open = False
+        self.opened = None
+
+        self.__lock = threading.Lock()
+
+    def record_failure(self):
+        # True when this failure opened the breaker
+        with self.__lock:
+            self.failures = self.failures + 1
+            if self.is_open or self.failures < self.failure_threshold:
+                return False
+            self.is_open = True
+            self.opened = time.monotonic()
+            return True
+
+    def record_success(self):
+        with self.__lock:
+            self.failures = 0
+            self.is_open = False
+            self.opened = None
+
+
+class Transport:
+    """
+    Posts requests to the device with requests, within the time budget of
+    their command. Idempotent commands are retried with a jittered backoff,
+    and once the device stops answering the circuit breaker makes requests
+    fail fast while a thread probes it until it's back.
+    """
+
+    def __init__(self, url, session, connect_timeout=5, read_timeout=10, retries=2, failure_threshold=3,
+                 probe_interval=5, max_probe_interval=60):
+        self.url = url
+        self.session = session
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.probe_interval = probe_interval
+        self.max_probe_interval = max_probe_interval
+
+        self.breaker = CircuitBreaker(failure_threshold)
+
+        self.__closed = threading.Event()
+        self.__probe_thread = None
+
+    @property
+    def available(self):
+        return not self.breaker.is_open
+
+    def close(self):
+        self.__closed.set()
+
+    def post(self, request_dict, body):
+        if self.breaker.is_open:
+            raise DeviceUnavailableError('{0} is not responding'.format(self.url))
+
+        deadline = time.monotonic() + command_budget(request_dict)
+        attempts = self.retries + 1 if is_idempotent(request_dict) else 1
+        for attempt in range(attempts):
+            remaining = max(deadline - time.monotonic(), 0.1)
+            try:
+                response = self.session.post(self.url, body, timeout=(
+                    min(self.connect_timeout, remaining), min(self.read_timeout, remaining)))
+            except (requests.ConnectionError, requests.Timeout) as ex:
+                error = ex
+            else:
+                self.breaker.record_success()
+                return parse_response(response.content)
+
+            delay = backoff(attempt)
+            if attempt + 1 == attempts or time.monotonic() + delay >= deadline:
+                break
+            time.sleep(delay)
+
+        if self.breaker.record_failure():
+            self.__start_probing()
+        raise error
+
+    def __probe(self):
+        interval = self.probe_interval
+        while not self.__closed.wait(random.uniform(interval / 2, interval)):
+            try:
+                self.session.post(self.url, PROBE_REQUEST, timeout=(self.connect_timeout, self.read_timeout))
+            except (requests.ConnectionError, requests.Timeout):
+                interval = min(interval * 2, self.max_probe_interval)
+                continue
+            self.breaker.record_success()
+            return
+
+    def __start_probing(self):
+        if self.__probe_thread is None or not self.__probe_thread.is_alive():
+            self.__probe_thread = threading.Thread(target=self.__probe, name='pixoo-probe', daemon=True)
+            self.__probe_thread.start()
+
+
+__all__ = (CircuitBreaker, DeviceUnavailableError, Transport, is_idempotent, parse_response)
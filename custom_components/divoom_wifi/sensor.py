@@ -0,0 +1,84 @@
+"""Diagnostic sensors for Divoom Wifi, disabled until enabled by the user."""
+from __future__ import annotations
+
+from collections.abc import Callable
+from typing import Any
+
+from homeassistant.components.sensor import SensorEntity, SensorStateClass
+from homeassistant.config_entries import ConfigEntry
+from homeassistant.const import CONF_MAC, EntityCategory, UnitOfTime
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
+
+from .const import DOMAIN, CONF_DEVICE_TYPE
+from .coordinator import DivoomWifiCoordinator
+
+
+def _frame_latency(statistics: dict[str, Any]) -> float | None:
+    return statistics["commands"].get("Draw/SendHttpGif", {}).get("p95_ms")
+
+
+def _request_errors(statistics: dict[str, Any]) -> int:
+    return sum(command["error_count"] for command in statistics["commands"].values())
+
+
+# Key, name, unit, state class and how to get the value from the statistics
+SENSORS: tuple[tuple[str, str, str | None, SensorStateClass, Callable[[dict[str, Any]], Any]], ...] = (
+    ("frames_sent", "Frames sent", None, SensorStateClass.TOTAL_INCREASING,
+     lambda statistics: statistics["frames_sent"]),
+    ("frames_skipped", "Frames skipped", None, SensorStateClass.TOTAL_INCREASING,
+     lambda statistics: statistics["frames_skipped"]),
+    ("frame_latency", "Frame latency (p95)", UnitOfTime.MILLISECONDS, SensorStateClass.MEASUREMENT,
+     _frame_latency),
+    ("request_errors", "Request errors", None, SensorStateClass.TOTAL_INCREASING, _request_errors),
+)
+
+
+async def async_setup_entry(
+    hass: HomeAssistant,
+    entry: ConfigEntry,
+    async_add_entities: AddEntitiesCallback,
+) -> None:
+    """Set up the Divoom Wifi diagnostic sensors based on config entry"""
+    if entry is None:
+        return
+
+    data = {
+        "name": entry.title,
+        "mac": entry.data[CONF_MAC],
+        "device_type": entry.data[CONF_DEVICE_TYPE]
+    }
+
+    coordinator = hass.data[DOMAIN][entry.entry_id]["divoom_coordinator"]
+
+    async_add_entities([DivoomWifiStatisticSensor(sensor, data, coordinator) for sensor in SENSORS])
+
+
+class DivoomWifiStatisticSensor(CoordinatorEntity[DivoomWifiCoordinator], SensorEntity):
+    """One of the numbers the device client measures, updated with the coordinator."""
+
+    _attr_has_entity_name = True
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+    _attr_entity_registry_enabled_default = False
+
+    def __init__(self, sensor, data, coordinator: DivoomWifiCoordinator) -> None:
+        super().__init__(coordinator)
+        key, name, unit, state_class, value = sensor
+
+        self._attr_name = name
+        self._attr_unique_id = "{}-{}".format(data["mac"], key)
+        self._attr_native_unit_of_measurement = unit
+        self._attr_state_class = state_class
+        self._attr_device_info = {
+            "name": data["name"],
+            "manufacturer": "divoom",
+            "model": data["device_type"]
+        }
+
+        self._value = value
+        self._divoomWifiDevice = coordinator.device
+
+    @property
+    def native_value(self) -> Any:
+        return self._value(self._divoomWifiDevice.statistics)